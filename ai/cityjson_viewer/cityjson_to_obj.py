@@ -27,6 +27,14 @@ class Cityjson2Obj(QObject):
                 cityjson_data = json.load(f)
 
             vertices = cityjson_data.get("vertices", [])
+            transform = cityjson_data.get("transform")
+            if transform is not None:
+                # CityJSON 1.1 stores integer vertices, scale them back
+                scale, translate = transform["scale"], transform["translate"]
+                vertices = [
+                    [vertex[i] * scale[i] + translate[i] for i in range(3)]
+                    for vertex in vertices
+                ]
             city_objects = cityjson_data.get("CityObjects", {})
 
             with tqdm(city_objects.items(), desc="Preparing City Object", unit="Object") as pbar:
@@ -1,19 +1,11 @@
-import laspy
 import numpy as np
 import argparse
 
+from utils.dgcnn import partition_blocks
+from utils.io_las import RGB_DIMENSIONS, read_las_array
+
 def read_las(las_files):
-    inFile = laspy.read(las_files) # read a las file
-    x = inFile.x
-    y = inFile.y
-    z = inFile.z
-    r = inFile.red
-    g = inFile.green
-    b = inFile.blue
-    # i = inFile.intensity
-    data = np.column_stack((x, y, z, r, g, b))
-    # data = np.column_stack((x, y, z, i))
-    return data
+    return read_las_array(las_files, RGB_DIMENSIONS) # read a las file chunk by chunk
 
 def calculate_block_size(data, block_size):
     """
@@ -51,23 +43,7 @@ def split_array(data, num_blocks_x, num_blocks_y, block_size):
     Returns:
     - List of numpy arrays, each representing a block
     """
-    blocks = []
-    # Calculate the minimum extent of x and y coordinates
-    min_extent_x = np.min(data[:, 0])
-    min_extent_y = np.min(data[:, 1])
-    for i in range(num_blocks_x):
-        for j in range(num_blocks_y):
-            # Calculate the start and end indices for the current block in x and y directions
-            start_x = min_extent_x + i * block_size
-            end_x = start_x + block_size
-            start_y = min_extent_y + j * block_size
-            end_y = start_y + block_size
-            
-            # Filter points within the current block
-            block_points = data[(data[:, 0] >= start_x) & (data[:, 0] < end_x) &
-                                (data[:, 1] >= start_y) & (data[:, 1] < end_y)]
-            blocks.append(block_points)
-    return blocks
+    return list(partition_blocks(data, block_size, num_blocks_x, num_blocks_y))
 
 
 def merge_blocks(blocks):
@@ -25,10 +25,32 @@ class DGCNNParams:
     emb_dims: int = 1024
     # Num of nearest neighbors to use (metavar='N')
     k: int = 20
+    # Points per tile of the kNN distance matrix, None computes it whole
+    knn_chunk_size: Optional[int] = 1024
+    # Reuse the spatial neighbors of the first layer in every layer
+    reuse_knn: bool = False
     # Name of point cloud data (required)
     point_cloud: str = ""
     # Size of each block
     block_size: int = 1000
+    # Blocks with fewer points are merged into the nearest larger block
+    min_block_points: int = 16384
+    # Directory to memory-map the split point cloud in, None keeps it in memory
+    spill_dir: Optional[str] = None
+    # Keep the loaded model for the next run instead of freeing it at the end
+    keep_model_warm: bool = False
+    # Vote with the class probabilities instead of one vote per prediction
+    soft_vote: bool = False
+    # Seed of the window padding and shuffling, None for a random one
+    seed: Optional[int] = None
+    # Device to classify on: "cuda", "cpu" or "auto" for CUDA when available
+    device: str = "auto"
+    # CPU threads used by torch, None keeps the torch default
+    num_threads: Optional[int] = None
+    # On CPU, quantize the pointwise convolutions to dynamic int8
+    quantize: bool = False
+    # Batches prepared ahead of the classifier on a background thread
+    prefetch_batches: int = 2
     # model directory
     model: str = ""
     # output path directory
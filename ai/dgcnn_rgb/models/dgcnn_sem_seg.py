@@ -23,7 +23,7 @@ import torch.nn as nn
 import torch.nn.parallel
 import torch.nn.init as init
 import torch.utils.data
-from .dgcnn_utils import get_graph_feature
+from .dgcnn_utils import get_graph_feature, knn
 import torch.nn.functional as F
 
 class dgcnn_sem_seg(nn.Module):
@@ -31,6 +31,10 @@ class dgcnn_sem_seg(nn.Module):
         super(dgcnn_sem_seg, self).__init__()
         self.args = args
         self.k = args.k
+        # Query points per pairwise distance tile of the kNN, None for the whole cloud at once
+        self.knn_chunk_size = args.knn_chunk_size
+        # Use the spatial neighbors of the first EdgeConv in every layer instead of feature space kNN
+        self.reuse_knn = args.reuse_knn
         
         self.bn1 = nn.BatchNorm2d(64)
         self.bn2 = nn.BatchNorm2d(64)
@@ -58,17 +62,19 @@ class dgcnn_sem_seg(nn.Module):
         batch_size = x.size(0)
         num_points = x.size(2)
 
-        x = get_graph_feature(x, k=self.k, dim9=True)   # (batch_size, 9, num_points) -> (batch_size, 9*2, num_points, k)
+        idx = knn(x[:, 6:], k=self.k, chunk_size=self.knn_chunk_size) if self.reuse_knn else None
+
+        x = get_graph_feature(x, k=self.k, idx=idx, dim9=True, chunk_size=self.knn_chunk_size)   # (batch_size, 9, num_points) -> (batch_size, 9*2, num_points, k)
         x = self.conv1(x)                       # (batch_size, 9*2, num_points, k) -> (batch_size, 64, num_points, k)
         x = self.conv2(x)                       # (batch_size, 64, num_points, k) -> (batch_size, 64, num_points, k)
         x1 = x.max(dim=-1, keepdim=False)[0]    # (batch_size, 64, num_points, k) -> (batch_size, 64, num_points)
 
-        x = get_graph_feature(x1, k=self.k)     # (batch_size, 64, num_points) -> (batch_size, 64*2, num_points, k)
+        x = get_graph_feature(x1, k=self.k, idx=idx, chunk_size=self.knn_chunk_size)     # (batch_size, 64, num_points) -> (batch_size, 64*2, num_points, k)
         x = self.conv3(x)                       # (batch_size, 64*2, num_points, k) -> (batch_size, 64, num_points, k)
         x = self.conv4(x)                       # (batch_size, 64, num_points, k) -> (batch_size, 64, num_points, k)
         x2 = x.max(dim=-1, keepdim=False)[0]    # (batch_size, 64, num_points, k) -> (batch_size, 64, num_points)
 
-        x = get_graph_feature(x2, k=self.k)     # (batch_size, 64, num_points) -> (batch_size, 64*2, num_points, k)
+        x = get_graph_feature(x2, k=self.k, idx=idx, chunk_size=self.knn_chunk_size)     # (batch_size, 64, num_points) -> (batch_size, 64*2, num_points, k)
         x = self.conv5(x)                       # (batch_size, 64*2, num_points, k) -> (batch_size, 64, num_points, k)
         x3 = x.max(dim=-1, keepdim=False)[0]    # (batch_size, 64, num_points, k) -> (batch_size, 64, num_points)
 
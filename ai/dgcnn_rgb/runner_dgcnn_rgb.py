@@ -9,25 +9,18 @@ Date: Nov 2019
 """
 import argparse
 import os
-import shutil
 import torch
-import torch.nn as nn
 import logging
-from pathlib import Path
 import sys
 import numpy as np
-import laspy
 import time
-import re
 
 from .models.dgcnn_sem_seg import dgcnn_sem_seg
 
 from .data_utils.dataLoader import ScannetDatasetWholeScene
-from .data_utils.split_merge_las import *
-from .data_utils.merge_las import append_to_las
 
-from utils.io_las import save_las
-from utils.dgcnn import add_vote
+from utils.io_las import RGB_DIMENSIONS, read_las_array, read_las_header, LasResultWriter
+from utils.dgcnn import DGCNNSession, StageTimes, add_vote, group_blocks, model_variant, partition_blocks, prefetch_batches
 from utils.common import get_filename_from_filepath, get_current_time_for_filename
 
 from .interface import DGCNNParams
@@ -62,90 +55,57 @@ class DGCNN(QtCore.QObject):
             start_time = time.time()
                 
             self.progress.emit("Read data", 5)
-            data = read_las(self.args.point_cloud)
-
-            self.xy_min = np.amin(data, axis=0)[0:2]
-            data[:, 0:2] -= self.xy_min
-            zeros_column = np.ones((data.shape[0], 1))
-            data = np.hstack((data, zeros_column))
+            header = read_las_header(self.args.point_cloud)
+            self.xy_min = np.asarray(header.mins[0:2], dtype=np.float64)
+            # float32 relative to the minimum x and y, read chunk by chunk with a placeholder label column
+            data = np.ones((header.point_count, len(RGB_DIMENSIONS) + 1), dtype=np.float32)
+            read_las_array(self.args.point_cloud, RGB_DIMENSIONS, xy_offset=self.xy_min, out=data)
             
-            data_dir = os.path.join(CUR_DIR, 'data', 'sem_seg_data') 
-            if not os.path.exists(data_dir):
-                os.makedirs(data_dir)
-                
-            num_blocks_x, num_blocks_y = calculate_block_size(data, self.args.block_size)
-            print("Number of blocks in x direction:", num_blocks_x)
-            print("Number of blocks in y direction:", num_blocks_y)
-            blocks = split_array(data, num_blocks_x, num_blocks_y, self.args.block_size)
+            blocks = partition_blocks(data, self.args.block_size)
+            del data
+            print("Number of blocks in x direction:", blocks.num_blocks_x)
+            print("Number of blocks in y direction:", blocks.num_blocks_y)
             print("Total number of blocks generated:", len(blocks))   
             print("Split data into blocks")
+
+            spill_file = None
+            if self.args.spill_dir is not None:
+                os.makedirs(self.args.spill_dir, exist_ok=True)
+                spill_file = os.path.join(self.args.spill_dir, f"{get_filename_from_filepath(self.args.point_cloud)}_blocks.npy")
+                blocks.spill(spill_file)
             
             self.progress.emit("Split data into blocks", 10)
-            for i, block in enumerate(blocks):
-                print("Block", i, "contains", len(block), "points")     
-                block_data_bytes = block.tobytes()
-                
-                # Calculate the size of block_data in bytes
-                block_data_size = len(block_data_bytes)
-                
-                # Check if the size is below 1 MB (1,048,576 bytes)
-                if block_data_size > 1_048_576:
-                    filename_offground_npy = os.path.join(data_dir, f'Area_{i}.npy')
-                    # Save the block_data if it meets the size criteria
-                    np.save(filename_offground_npy, block)
-                    print(f'Saved: {filename_offground_npy} (size: {block_data_size} bytes)')
-                else:
-                    print(f'Skipped: Block data size {block_data_size} bytes < 1 MB')
-                
-            areas = []
-            # Iterate over all files in the folder
-            for filename in os.listdir(data_dir):
-                # Check if the filename matches the pattern "Area_<number>.npy"
-                match = re.match(r'Area_(\d+)\.npy', filename)
-                if match:
-                    # Extract the number and convert it to an integer
-                    number = int(match.group(1))
-                    # Add the number to the list
-                    areas.append(number)
-
-            # Sort the list of numbers
-            areas.sort()
+            # Blocks too small to classify on their own join the nearest block
+            areas = group_blocks(blocks, self.args.min_block_points)
+            for area, members in areas.items():
+                print("Block", area, "contains", sum(len(blocks[key]) for key in members), "points from", len(members), "blocks")
             
             filename = f"{get_filename_from_filepath(self.args.point_cloud)}_{get_current_time_for_filename()}"
-            self.visual_dir = os.path.join(self.args.output_path, "visual", filename) 
-            self.visual_dir = Path(self.visual_dir)
-            self.visual_dir.mkdir(parents=True, exist_ok=True)
+            os.makedirs(self.args.output_path, exist_ok=True)
             
             self.progress.emit("Start Classification", 20)
             print("Start classification")
-            for index, test_area in enumerate(areas):
-                print("Classify Block ", test_area)
-                # self.args.test_area = test_area # --------------- is this really important ??? --------------- 
-                self.classification(filename, test_area)
-
-                percentage = 20 + (index/len(areas)*50)
-                self.progress.emit(f"Completed {index+1}/{len(areas)}", percentage)
-            
-            # Tambahan merge las
-            self.progress.emit("Merge classification results", 70)
-            print('Running Merge LAS')
-            
-            source_file = os.path.join(self.visual_dir, filename + '-block-' + str(test_area) + '.las')
-            destination_folder = os.path.join(self.args.output_path, "visual")
-            shutil.move(source_file, destination_folder)
-
-            las_copy = os.path.join(destination_folder, filename + '-block-' + str(test_area) + '.las')
-            out_las = os.path.join(destination_folder, filename + '_classified.las')
-            os.rename(las_copy, out_las)
-            
-            for (dirpath, dirnames, filenames) in os.walk(self.visual_dir):
-                for inFile in filenames:
-                    if inFile.endswith('.las'):
-                        in_las = os.path.join(dirpath, inFile)
-                        append_to_las(in_las, out_las)
-                
-            shutil.move (out_las, self.args.output_path)
-            print('Finished without errors - merge_LAS.py')
+            # Build and load the model once for every block
+            os.environ["CUDA_VISIBLE_DEVICES"] = self.args.gpu
+            if self.args.num_threads:
+                torch.set_num_threads(self.args.num_threads)
+            self.session = DGCNNSession.open(model_variant("dgcnn_rgb", self.args), lambda: dgcnn_sem_seg(self.args), self.args.model, device=self.args.device,
+                                             keep_warm=self.args.keep_model_warm, quantize=self.args.quantize)
+            self.classified_points, self.classification_time = 0, 0.0
+            self.stage_times = StageTimes()
+            # Every block is written straight into the one classified output, with
+            # the scales, offsets and CRS of the input
+            self.writer = LasResultWriter(os.path.join(self.args.output_path, filename + '_classified'), header=header)
+            try:
+                for index, (test_area, members) in enumerate(areas.items()):
+                    print("Classify Block ", test_area)
+                    self.classification(filename, test_area, blocks.gather(members))
+
+                    percentage = 20 + (index/len(areas)*50)
+                    self.progress.emit(f"Completed {index+1}/{len(areas)}", percentage)
+            finally:
+                self.writer.close()
+                self.session.release()
             
             # Record the end time
             end_time = time.time()
@@ -154,41 +114,33 @@ class DGCNN(QtCore.QObject):
             elapsed_time = end_time - start_time
             
             self.progress.emit("Remove temporary data", 95)
-            shutil.rmtree(data_dir)
-            shutil.rmtree(self.visual_dir)
-            shutil.rmtree(os.path.join(self.args.output_path, "visual"))
+            if spill_file is not None:
+                # the memory map has to be released before the file can be removed
+                del blocks
+                os.remove(spill_file)
 
             print(f"Elapsed Time: {elapsed_time} seconds")
+            print(f"Throughput: {self.classified_points / max(self.classification_time, 1e-9):.0f} points/sec on {self.session.device}")
+            print(f"Classification stages: {self.stage_times.report()}")
             self.finished.emit("Finished")
         
         except Exception as e:
             print(f"Error : {e}")
             self.error.emit(str(e))
 
-    def classification(self, filename, test_area):   
+    def classification(self, filename, test_area, scene):   
         '''HYPER PARAMETER'''
-        os.environ["CUDA_VISIBLE_DEVICES"] = self.args.gpu
 
         NUM_CLASSES = self.args.num_classes
         BATCH_SIZE = self.args.batch_size
         NUM_POINT = self.args.num_point
 
-        root = os.path.join(CUR_DIR, 'data', 'sem_seg_data')
-
-        # TEST_DATASET_WHOLE_SCENE = ScannetDatasetWholeScene(root, split='test', test_area=self.args.test_area, block_points=NUM_POINT) # --------------- is this really important ??? --------------- 
-        TEST_DATASET_WHOLE_SCENE = ScannetDatasetWholeScene(root, split='test', test_area=test_area, block_points=NUM_POINT)
+        TEST_DATASET_WHOLE_SCENE = ScannetDatasetWholeScene(split='test', test_area=test_area, block_points=NUM_POINT, scenes={test_area: scene}, seed=self.args.seed)
 
-        '''MODEL LOADING'''
-        classifier = dgcnn_sem_seg(self.args).cuda()
-        classifier = nn.DataParallel(classifier)
-        checkpoint = torch.load(self.args.model, weights_only=False)
-        classifier.load_state_dict(checkpoint)
-        
-        classifier = classifier.eval()
+        classifier = self.session
+        classification_start = time.time()
 
-        with torch.no_grad():
-            scene_id = TEST_DATASET_WHOLE_SCENE.file_list
-            scene_id = [x[:-4] for x in scene_id]
+        with torch.inference_mode():
         
             # Edit num_batches = 1
             num_batches = 1 #len(TEST_DATASET_WHOLE_SCENE)   
@@ -198,53 +150,28 @@ class DGCNN(QtCore.QObject):
                 whole_scene_data = TEST_DATASET_WHOLE_SCENE.scene_points_list[batch_idx]
                 whole_scene_label = TEST_DATASET_WHOLE_SCENE.semantic_labels_list[batch_idx]
                 vote_label_pool = np.zeros((whole_scene_label.shape[0], NUM_CLASSES))            
-                scene_data, scene_label, scene_smpw, scene_point_index = TEST_DATASET_WHOLE_SCENE[batch_idx]
-                num_blocks = scene_data.shape[0]
-                s_batch_num = (num_blocks + BATCH_SIZE - 1) // BATCH_SIZE
-                batch_data = np.zeros((BATCH_SIZE, NUM_POINT, 9)) #XYZ, RGB, NormXYZ
-                batch_label = np.zeros((BATCH_SIZE, NUM_POINT))
-                batch_point_index = np.zeros((BATCH_SIZE, NUM_POINT))
-                batch_smpw = np.zeros((BATCH_SIZE, NUM_POINT))
-
-                for sbatch in range(s_batch_num):
-                    start_idx = sbatch * BATCH_SIZE
-                    end_idx = min((sbatch + 1) * BATCH_SIZE, num_blocks)
-                    real_batch_size = end_idx - start_idx
-                    batch_data[0:real_batch_size, ...] = scene_data[start_idx:end_idx, ...]
-                    batch_label[0:real_batch_size, ...] = scene_label[start_idx:end_idx, ...]
-                    batch_point_index[0:real_batch_size, ...] = scene_point_index[start_idx:end_idx, ...]
-                    batch_smpw[0:real_batch_size, ...] = scene_smpw[start_idx:end_idx, ...]
-                    batch_data[:, :, 3:6] /= 1.0 # Normalize color
-
-                    torch_data = torch.Tensor(batch_data)
-                    torch_data = torch_data.float().cuda()
-                    torch_data = torch_data.transpose(2, 1)
-
-                    seg_pred  = classifier(torch_data)
-
-                    seg_pred = seg_pred.permute(0, 2, 1).contiguous()
-                    pred = seg_pred.max(dim=2)[1]
-                    pred_np = pred.detach().cpu().numpy()
-                    
-                    vote_label_pool = add_vote(vote_label_pool, batch_point_index[0:real_batch_size, ...],
-                                            pred_np[0:real_batch_size, ...],
-                                            batch_smpw[0:real_batch_size, ...])
-                    
-                    
+                # Windows and tensors of the next batches are prepared on a background thread
+                batches = prefetch_batches(lambda: TEST_DATASET_WHOLE_SCENE.windows(batch_idx), BATCH_SIZE, pin_memory=classifier.device.type == "cuda",
+                                           depth=self.args.prefetch_batches, times=self.stage_times)
+
+                for torch_data, batch_point_index, batch_smpw in batches:
+                    with self.stage_times.stage("inference"):
+                        seg_pred  = classifier(torch_data)
+
+                        seg_pred = seg_pred.permute(0, 2, 1).contiguous()
+                        pred = seg_pred.max(dim=2)[1]
+                        pred_np = pred.detach().cpu().numpy()
+                        # Class probabilities when voting with soft votes
+                        scores_np = torch.softmax(seg_pred, dim=2).cpu().numpy() if self.args.soft_vote else None
+
+                    with self.stage_times.stage("vote"):
+                        vote_label_pool = add_vote(vote_label_pool, batch_point_index, pred_np, batch_smpw, scores_np)
+
                 pred_label =  np.argmax(vote_label_pool, 1)
-                
-                result_data = []
 
-                whole_scene_data = whole_scene_data.astype(np.float64)
-                
-                # Change to UTM
-                whole_scene_data[:, 0:2] += self.xy_min
+                # Change to UTM while writing
+                with self.stage_times.stage("write"):
+                    self.writer.write(whole_scene_data, labels=pred_label, xy_offset=self.xy_min)
 
-                for i in range(whole_scene_label.shape[0]):
-                    data_point = [whole_scene_data[i, 0], whole_scene_data[i, 1], whole_scene_data[i, 2], whole_scene_data[i, 3], whole_scene_data[i, 4], whole_scene_data[i, 5], pred_label[i]]
-                    result_data.append(data_point)
-                
-                result_data = np.array(result_data)
-                        
-                filename = os.path.join(self.visual_dir, filename + '-block-' + str(test_area))
-                save_las(result_data, filename)
+                self.classified_points += whole_scene_label.shape[0]
+                self.classification_time += time.time() - classification_start
@@ -10,6 +10,8 @@ import json
 import cv2
 import pickle
 
+from utils.dgcnn import iter_scene_windows, whole_scene_windows
+
 ##########################################################################
 # Add new classes for loading data from h5 files
 def load_data_semseg(partition, test_area):
@@ -74,8 +76,12 @@ class S3DIS(Dataset):
 # Define class for testing set data loader
 class ScannetDatasetWholeScene():
     # prepare to give prediction on each points
-    def __init__(self, root, block_points=4096, split='test', test_area=5, stride=25.0, block_size=25.0, padding=0.001):
+    # scenes: area number -> points with the label in the last column, used
+    # instead of reading the Area_<number>.npy files of root
+    # seed: makes the padding and shuffling of every scene reproducible
+    def __init__(self, root=None, block_points=4096, split='test', test_area=5, stride=25.0, block_size=25.0, padding=0.001, scenes=None, seed=None):
         self.block_points = block_points
+        self.seed = seed
         self.block_size = block_size
         self.padding = padding
         self.root = root
@@ -83,15 +89,21 @@ class ScannetDatasetWholeScene():
         self.stride = stride
         self.scene_points_num = []
         assert split in ['train', 'test']
-        if self.split == 'train':
-            self.file_list = [d for d in os.listdir(root) if d.find('Area_%d' % test_area) == -1]
-        else:
-            self.file_list = [d for d in os.listdir(root) if d.find('Area_%d' % test_area) != -1]
+        if scenes is None:
+            if self.split == 'train':
+                file_list = [d for d in os.listdir(root) if d.find('Area_%d' % test_area) == -1]
+            else:
+                file_list = [d for d in os.listdir(root) if d.find('Area_%d' % test_area) != -1]
+            scenes = {file: None for file in file_list}
+        # scene names: the .npy file names, or the keys of scenes
+        self.file_list = []
         self.scene_points_list = []
         self.semantic_labels_list = []
         self.room_coord_min, self.room_coord_max = [], []
-        for file in self.file_list:
-            data = np.load(os.path.join(root, file))
+        for name, data in scenes.items():
+            if data is None:
+                data = np.load(os.path.join(root, name))
+            self.file_list.append(name)
             points = data[:, :3]
             self.scene_points_list.append(data[:, :-1])
             self.semantic_labels_list.append(data[:, -1])
@@ -109,57 +121,26 @@ class ScannetDatasetWholeScene():
         # self.labelweights = np.power(np.amax(labelweights) / labelweights, 1 / 3.0)
         self.labelweights = np.power(np.amax(labelweights) / (labelweights + 1e-6), 1 / 3.0)
 
-    def __getitem__(self, index):
+    @staticmethod
+    def normalize(data_batch):
+        # data_batch[:,3:6] /= 255 # Normalize color (if using RGB)
+        data_batch[:, 3] /= np.max(data_batch[:, 3]) # Normalize intensity by maximum value
+
+    def _scene(self, index):
         point_set_ini = self.scene_points_list[index]
         points = point_set_ini[:,:178]
         labels = self.semantic_labels_list[index]
-        coord_min, coord_max = np.amin(points, axis=0)[:3], np.amax(points, axis=0)[:3]
-        grid_x = int(np.ceil(float(coord_max[0] - coord_min[0] - self.block_size) / self.stride) + 1)
-        grid_y = int(np.ceil(float(coord_max[1] - coord_min[1] - self.block_size) / self.stride) + 1)
-        data_room, label_room, sample_weight, index_room = np.array([]), np.array([]), np.array([]),  np.array([])
-        for index_y in range(0, grid_y):
-            for index_x in range(0, grid_x):
-                s_x = coord_min[0] + index_x * self.stride
-                e_x = min(s_x + self.block_size, coord_max[0])
-                s_x = e_x - self.block_size
-                s_y = coord_min[1] + index_y * self.stride
-                e_y = min(s_y + self.block_size, coord_max[1])
-                s_y = e_y - self.block_size
-                point_idxs = np.where(
-                    (points[:, 0] >= s_x - self.padding) & (points[:, 0] <= e_x + self.padding) & (points[:, 1] >= s_y - self.padding) & (
-                                points[:, 1] <= e_y + self.padding))[0]
-                if point_idxs.size == 0:
-                    continue
-                num_batch = int(np.ceil(point_idxs.size / self.block_points))
-                point_size = int(num_batch * self.block_points)
-                replace = False if (point_size - point_idxs.size <= point_idxs.size) else True
-                point_idxs_repeat = np.random.choice(point_idxs, point_size - point_idxs.size, replace=replace)
-                point_idxs = np.concatenate((point_idxs, point_idxs_repeat))
-                np.random.shuffle(point_idxs)
-                data_batch = points[point_idxs, :]
-                normlized_xyz = np.zeros((point_size, 3))
-                normlized_xyz[:, 0] = data_batch[:, 0] / coord_max[0]
-                normlized_xyz[:, 1] = data_batch[:, 1] / coord_max[1]
-                normlized_xyz[:, 2] = data_batch[:, 2] / coord_max[2]
-                data_batch[:, 0] = data_batch[:, 0] - (s_x + self.block_size / 2.0)
-                data_batch[:, 1] = data_batch[:, 1] - (s_y + self.block_size / 2.0)
+        # one stream per scene, so a scene does not depend on the others read before it
+        rng = np.random.default_rng(None if self.seed is None else [self.seed, index])
+        return (points, labels, self.labelweights, self.block_points, self.block_size,
+                self.stride, self.padding, self.normalize, rng)
 
-                # data_batch[:,3:6] /= 255 # Normalize color (if using RGB)
-                data_batch[:, 3] /= np.max(data_batch[:, 3]) # Normalize intensity by maximum value
-                
-                data_batch = np.concatenate((data_batch, normlized_xyz), axis=1)
-                label_batch = labels[point_idxs].astype(int)
-                batch_weight = self.labelweights[label_batch]
+    def __getitem__(self, index):
+        return whole_scene_windows(*self._scene(index))
 
-                data_room = np.vstack([data_room, data_batch]) if data_room.size else data_batch
-                label_room = np.hstack([label_room, label_batch]) if label_room.size else label_batch
-                sample_weight = np.hstack([sample_weight, batch_weight]) if label_room.size else batch_weight
-                index_room = np.hstack([index_room, point_idxs]) if index_room.size else point_idxs
-        data_room = data_room.reshape((-1, self.block_points, data_room.shape[1]))
-        label_room = label_room.reshape((-1, self.block_points))
-        sample_weight = sample_weight.reshape((-1, self.block_points))
-        index_room = index_room.reshape((-1, self.block_points))
-        return data_room, label_room, sample_weight, index_room
+    def windows(self, index):
+        # the batches of __getitem__, built lazily one window at a time
+        return iter_scene_windows(*self._scene(index))
 
     def __len__(self):
         return len(self.scene_points_list)
\ No newline at end of file
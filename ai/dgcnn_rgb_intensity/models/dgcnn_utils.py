@@ -12,25 +12,38 @@ from torch.autograd import Variable
 import numpy as np
 import torch.nn.functional as F
 
-def knn(x, k):
-    inner = -2*torch.matmul(x.transpose(2, 1), x)
-    xx = torch.sum(x**2, dim=1, keepdim=True)
-    pairwise_distance = -xx - inner - xx.transpose(2, 1)
- 
-    idx = pairwise_distance.topk(k=k, dim=-1)[1]   # (batch_size, num_points, k)
+def knn(x, k, chunk_size=None):
+    num_points = x.size(2)
+    if chunk_size is None or chunk_size >= num_points:
+        inner = -2*torch.matmul(x.transpose(2, 1), x)
+        xx = torch.sum(x**2, dim=1, keepdim=True)
+        pairwise_distance = -xx - inner - xx.transpose(2, 1)
+     
+        idx = pairwise_distance.topk(k=k, dim=-1)[1]   # (batch_size, num_points, k)
+        return idx
+
+    # Top-k over tiles of chunk_size query points, so only a (batch_size, chunk_size, num_points)
+    # block of the pairwise distances exists at a time
+    xx = torch.sum(x**2, dim=1, keepdim=True)   # (batch_size, 1, num_points)
+    idx = torch.empty((x.size(0), num_points, k), dtype=torch.long, device=x.device)
+    for start in range(0, num_points, chunk_size):
+        stop = min(start + chunk_size, num_points)
+        inner = -2*torch.matmul(x[:, :, start:stop].transpose(2, 1), x)   # (batch_size, chunk_size, num_points)
+        pairwise_distance = -xx - inner - xx[:, :, start:stop].transpose(2, 1)
+        idx[:, start:stop] = pairwise_distance.topk(k=k, dim=-1)[1]
     return idx
 
 
-def get_graph_feature(x, k=20, idx=None, dim9=False):
+def get_graph_feature(x, k=20, idx=None, dim9=False, chunk_size=None):
     batch_size = x.size(0)
     num_points = x.size(2)
     x = x.view(batch_size, -1, num_points)
     if idx is None:
         if dim9 == False:
-            idx = knn(x, k=k)   # (batch_size, num_points, k)
+            idx = knn(x, k=k, chunk_size=chunk_size)   # (batch_size, num_points, k)
         else:
-            idx = knn(x[:, 6:], k=k)
-    device = torch.device('cuda')
+            idx = knn(x[:, 6:], k=k, chunk_size=chunk_size)
+    device = x.device
 
     idx_base = torch.arange(0, batch_size, device=device).view(-1, 1, 1)*num_points
 
@@ -45,6 +58,7 @@ def get_graph_feature(x, k=20, idx=None, dim9=False):
     feature = feature.view(batch_size, num_points, k, num_dims) 
     x = x.view(batch_size, num_points, 1, num_dims).repeat(1, 1, k, 1)
     
-    feature = torch.cat((feature-x, x), dim=3).permute(0, 3, 1, 2).contiguous()
+    # left in channels last strides, the 1x1 convolutions read them without a copy
+    feature = torch.cat((feature-x, x), dim=3).permute(0, 3, 1, 2)
   
     return feature      # (batch_size, 2*num_dims, num_points, k)
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Sidecar cache of generated buildings for incremental LOD generation.
+A building is keyed by the hash of its outline, its roof segments, the surface
+and dem cells it is draped on and the generation settings, so a rerun only
+generates the buildings whose input changed.
+"""
+import json
+import sqlite3
+from hashlib import blake2b
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+import shapely
+
+from ._drape import _calc_rows_cols, _kernel_mid
+from ._raster import read_window
+
+# bump when the generated geometry changes, older entries are then ignored
+CACHE_VERSION = 1
+# keys per SELECT, below the SQLite host parameter limit
+CACHE_QUERY_SIZE = 500
+
+
+class BuildingCache:
+    """Generated CityObjects and their local vertices stored in SQLite
+
+    Arguments:
+        path {str} -- cache file, created when it does not exist
+        settings {Dict} -- generation settings every key depends on
+    """
+
+    def __init__(self, path: str, settings: Dict[str, Any]):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS buildings ("
+            "key TEXT PRIMARY KEY, city_object TEXT NOT NULL, "
+            "vertices BLOB NOT NULL, vertex_count TEXT NOT NULL, run TEXT NOT NULL)"
+        )
+        self.settings = json.dumps(
+            {"version": CACHE_VERSION, **settings}, sort_keys=True, default=str
+        ).encode()
+        # entries not used by this run are pruned once it completes
+        self.run = uuid4().hex
+        self.hits = 0
+        self.misses = 0
+
+    def building_key(
+        self, building: Dict, surface: Dict, dem: Dict, radius: Optional[float]
+    ) -> str:
+        digest = blake2b(self.settings, digest_size=16)
+        rings = [
+            np.ascontiguousarray(np.asarray(linear_ring, dtype=np.float64)[:, :2])
+            for linear_ring in building["geometry"]["coordinates"]
+        ]
+        for ring in rings:
+            digest.update(len(ring).to_bytes(8, "little"))
+            digest.update(ring.tobytes())
+        for segment in building.get("roof_segments", []):
+            digest.update(shapely.to_wkb(segment))
+
+        coords = np.concatenate(rings)
+        for raster in (surface, dem):
+            if raster["array"] is not None:
+                digest.update(_window_bytes(coords, raster, radius))
+        return digest.hexdigest()
+
+    def get(self, keys: List[str]) -> Dict[str, Tuple[Dict, List[List[float]], List[int]]]:
+        """Cached CityObject, local vertices and vertex count of the known keys"""
+        found = {}
+        for start in range(0, len(keys), CACHE_QUERY_SIZE):
+            batch = keys[start : start + CACHE_QUERY_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(
+                "SELECT key, city_object, vertices, vertex_count FROM buildings "
+                f"WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+            for key, city_object, vertices, vertex_count in rows:
+                found[key] = (
+                    json.loads(city_object),
+                    np.frombuffer(vertices, dtype=np.float64).reshape(-1, 3).tolist(),
+                    json.loads(vertex_count),
+                )
+            self.connection.execute(
+                f"UPDATE buildings SET run = ? WHERE key IN ({placeholders})",
+                [self.run, *batch],
+            )
+
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put(
+        self, key: str, city_object: Dict, vertices: List[List[float]], vertex_count: List[int]
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO buildings VALUES (?, ?, ?, ?, ?)",
+            (
+                key,
+                json.dumps(city_object),
+                np.asarray(vertices, dtype=np.float64).tobytes(),
+                json.dumps(vertex_count),
+                self.run,
+            ),
+        )
+
+    def prune(self) -> None:
+        """Drop the buildings that no longer exist in the input"""
+        self.connection.execute("DELETE FROM buildings WHERE run != ?", (self.run,))
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+
+def _window_bytes(coords: np.ndarray, raster: Dict, radius: Optional[float]) -> bytes:
+    # cells around the building, with the kernel halo of the drape modes
+    affine = raster["affine"]
+    rows, cols = _calc_rows_cols(coords, affine)
+    halo = _kernel_mid(affine[0], radius) + 1
+    array, row_off, col_off = read_window(
+        raster["array"],
+        int(rows.min()) - halo,
+        int(rows.max()) + halo + 1,
+        int(cols.min()) - halo,
+        int(cols.max()) + halo + 1,
+    )
+    header = np.array([row_off, col_off, *array.shape, *affine[:6]], dtype=np.float64)
+    return header.tobytes() + np.ascontiguousarray(array).tobytes()
@@ -3,16 +3,35 @@ Build 3D model of building with respective roofs.
 The output will be in cityjson format.
 Find more about cityjson in https://www.cityjson.org/
 """
+import copy
+import datetime
 import json
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple, Union
+import multiprocessing
+from collections import deque
+from contextlib import ExitStack
+from dataclasses import replace
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import fiona
+import geopandas as gpd
 import numpy as np
+import pandas as pd
 import rasterio
+from shapely.geometry import shape
 from tqdm.autonotebook import tqdm
 
-from ._drape import DRAPE_MODE
+from ._cache import BuildingCache
+from ._drape import DRAPE_BATCH_MODE
+from ._raster import SharedRaster, WindowedRaster
+from ._roof import (
+    assign_roof_segments,
+    create_roof_building,
+    fit_roof_planes,
+    load_roof_segments,
+    split_roof_segments,
+)
+from .interface import BuildingConfigPerLayer, BuildingSurface, Py3dModelConfig
 
 CJSON_SCHEMA: Dict[str, Any] = {
     "type": "CityJSON",
@@ -46,45 +65,13 @@ CJSON_SURFACE = (
     {"type": "WallSurface"},
 )
 
+# quantized vertices are stored in millimetres unless configured otherwise
+CJSON_DEFAULT_SCALE = 0.001
+CJSON_SEQ_EXTENT_PLACEHOLDER = "__geographicalExtent__"
+CJSON_SEQ_EXTENT_WIDTH = 160
 
-@dataclass
-class Py3dModelConfig:
-    """A configuration for drape Shapefile to surface"""
-
-    input_building: str
-    input_surface: str
-    output_file: Optional[str] = None
-    input_roof: Optional[str] = None
-    mode: str = "onedge"
-    radius: Optional[float] = None
-    input_dem: Optional[str] = None
-    building_type: str = "MultiSurface"
-    texture: Optional[Dict] = None
-
-
-@dataclass
-class BuildingConfigPerLayer:
-    """A configuration to create building per layer"""
-
-    vertices: List
-    identifier: str
-    building_geometry: List[List[List[float]]]
-    surface: Dict[str, Union[np.ndarray, rasterio.Affine]]
-    radius: float
-    dem: Dict[str, Union[np.ndarray, rasterio.Affine]]
-    mode: str
-
-
-@dataclass
-class BuildingSurface:
-    """To save building surface data"""
-
-    geometry: Union[List[List[List[int]]], List[List[List[List[int]]]]]
-    semantic: List[int]
-    material: List[int]
 
-
-def create_model(config: Py3dModelConfig) -> Dict:
+def create_model(config: Py3dModelConfig, buildings: Optional[gpd.GeoDataFrame] = None) -> Dict:
     """
     Create 3D building model from 2D polygon and Object Height Model (surface).
 
@@ -94,12 +81,17 @@ def create_model(config: Py3dModelConfig) -> Dict:
                 input_surface_tiff (str) : surface in tiff file location
                 output_file (str) : where to save the file
                 input_roof_shp (str) : roof shp file location
+            buildings (gpd.GeoDataFrame) : singlepart buildings already in
+                memory, used instead of reading input_building
         Returns:
-            cityjson_res (dict) : 3D model in cityjson
+            cityjson_res (dict) : 3D model in cityjson, or only the header
+                when written as CityJSON Text Sequences
     """
-    with rasterio.open(config.input_surface) as surface, fiona.open(
-        config.input_building
-    ) as buildings:
+    with rasterio.open(config.input_surface) as surface, ExitStack() as cleanup:
+        if buildings is None:
+            buildings = cleanup.enter_context(fiona.open(config.input_building))
+        else:
+            buildings = _FrameCollection(buildings)
 
         # surface_epsg = str(surface.crs).split(":")[1]
         # buildings_epsg = buildings.crs["init"].split(":")[1]
@@ -112,18 +104,51 @@ def create_model(config: Py3dModelConfig) -> Dict:
             error_msg = f"Different ref. system : {v_epsg} and {s_epsg}"
             raise ValueError(error_msg)
 
-        surface_array = surface.read(1)
+        surface_array = _open_raster(surface, config)
+        cleanup.callback(_close_raster, surface_array)
         surface_affine = surface.transform
 
         lod = 1 if config.input_roof is None else 2
-        cityjson = CJSON_SCHEMA.copy()
+        roofs = (
+            None if lod == 1 else load_roof_segments(config.input_roof, buildings_epsg)
+        )
+        cache = None
+        if config.cache_file is not None:
+            cache = BuildingCache(
+                config.cache_file,
+                {
+                    "lod": lod,
+                    "mode": config.mode,
+                    "radius": config.radius,
+                    "building_type": config.building_type,
+                    "dem": config.input_dem is not None,
+                },
+            )
+            cleanup.callback(cache.close)
+        cityjson = copy.deepcopy(CJSON_SCHEMA)
         cityjson["metadata"][
             "referenceSystem"
         ] = f"urn:ogc:def:crs:EPSG::{buildings_epsg}"
 
+        if config.output_format == "cityjsonseq":
+            if config.output_file is None:
+                raise ValueError("CityJSONSeq output needs an output file")
+            return _write_cityjsonseq(
+                cityjson, buildings, surface_array, surface_affine, lod, config, roofs, cache
+            )
+        elif config.output_format != "cityjson":
+            raise ValueError("Undefined or unsupported output format")
+
         # drape and construct building surface
         building_vertex_count, vertices, cityjson = _create_buildings(
-            cityjson, buildings, surface_array, surface_affine, lod, config
+            cityjson,
+            buildings,
+            surface_array,
+            surface_affine,
+            lod,
+            config,
+            roofs=roofs,
+            cache=cache,
         )
 
         cityjson["vertices"] = vertices
@@ -136,7 +161,22 @@ def create_model(config: Py3dModelConfig) -> Dict:
             np.max(vertices_as_array[:, 1]),
             np.max(vertices_as_array[:, 2]),
         ]
-        
+
+        if config.vertex_scale is not None:
+            # CityJSON 1.1 integer vertices, shared corners stored once
+            scale = np.full(3, config.vertex_scale)
+            translate = vertices_as_array.min(axis=0)
+            cityjson["version"] = "1.1"
+            cityjson["transform"] = {
+                "scale": scale.tolist(),
+                "translate": translate.tolist(),
+            }
+            cityjson["vertices"], index_map = _quantize_vertices(
+                vertices_as_array, translate, scale
+            )
+            for city_object in cityjson["CityObjects"].values():
+                _remap_city_object(city_object, index_map)
+
         if config.output_file is not None:
             with open(config.output_file, "w") as outfile:
                 json.dump(cityjson, outfile)
@@ -145,140 +185,682 @@ def create_model(config: Py3dModelConfig) -> Dict:
         return cityjson
 
 
+class _FrameCollection:
+    """GeoDataFrame read like the fiona collection of its features"""
+
+    def __init__(self, frame: gpd.GeoDataFrame):
+        # index levels become attributes, as GeoDataFrame.to_file writes them
+        if list(frame.index.names) != [None] or not pd.api.types.is_integer_dtype(frame.index.dtype):
+            frame = frame.reset_index()
+        self.frame = frame
+        self.crs = frame.crs
+        self.bounds = tuple(frame.total_bounds)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for feature in self.frame.iterfeatures(na="null"):
+            feature["properties"] = {
+                key: _attribute_value(value) for key, value in feature["properties"].items()
+            }
+            yield feature
+
+
+def _attribute_value(value: Any) -> Any:
+    """Attribute as fiona reads it, dates as ISO strings and numpy scalars as
+    python values, so the model can be written as JSON"""
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _open_raster(
+    dataset: rasterio.DatasetReader, config: Py3dModelConfig
+) -> Union[np.ndarray, WindowedRaster, SharedRaster]:
+    """Read the first band at once or wrap it for windowed sampling"""
+    if config.raster_access == "full" and config.workers > 1:
+        # read once into shared memory, workers map it by name
+        return SharedRaster.from_dataset(dataset)
+    elif config.raster_access == "full":
+        return dataset.read(1)
+    elif config.raster_access == "windowed":
+        # surface and dem share the memory ceiling
+        raster_count = 1 if config.input_dem is None else 2
+        return WindowedRaster(dataset, max_memory=config.raster_memory / raster_count)
+    else:
+        raise ValueError("Undefined or unsupported raster access")
+
+
+def _close_raster(raster: Union[np.ndarray, WindowedRaster, SharedRaster]) -> None:
+    if isinstance(raster, SharedRaster):
+        raster.close()
+    elif isinstance(raster, WindowedRaster):
+        raster.clear()
+
+
 def _create_buildings(
     cityjson: Dict,
     buildings: fiona.collection,
-    surface_array: np.ndarray,
+    surface_array: Union[np.ndarray, WindowedRaster],
     surface_affine: rasterio.Affine,
     lod: int,
     config: Py3dModelConfig,
+    roofs: Optional[Tuple] = None,
+    cache: Optional[BuildingCache] = None,
     **args,
 ) -> Tuple[Dict, List, Dict]:
     """Create 3D Model per building"""
+    vertices: List[List[float]] = []
+    building_vertex_count: Dict[str, List[int]] = {}
+    for identifier, city_object, _, vertex_count in _iter_city_objects(
+        buildings,
+        surface_array,
+        surface_affine,
+        lod,
+        config,
+        vertices=vertices,
+        roofs=roofs,
+        cache=cache,
+    ):
+        building_vertex_count.update(vertex_count)
+        cityjson["CityObjects"][identifier] = city_object
+
+    return building_vertex_count, vertices, cityjson
+
+
+def _write_cityjsonseq(
+    cityjson: Dict,
+    buildings: fiona.collection,
+    surface_array: Union[np.ndarray, WindowedRaster],
+    surface_affine: rasterio.Affine,
+    lod: int,
+    config: Py3dModelConfig,
+    roofs: Optional[Tuple] = None,
+    cache: Optional[BuildingCache] = None,
+) -> Dict:
+    """Write CityJSON Text Sequences, one CityJSONFeature per line as soon as
+    the building is created. The header goes first with room reserved for the
+    geographicalExtent, which is filled in once every building is written."""
+    vertex_scale = (
+        CJSON_DEFAULT_SCALE if config.vertex_scale is None else config.vertex_scale
+    )
+    scale = np.full(3, vertex_scale)
+    translate = np.array([buildings.bounds[0], buildings.bounds[1], 0.0])
+
+    header = cityjson
+    header["version"] = "1.1"
+    header["transform"] = {"scale": scale.tolist(), "translate": translate.tolist()}
+    header["metadata"]["geographicalExtent"] = CJSON_SEQ_EXTENT_PLACEHOLDER
+
+    header_line = json.dumps(header, separators=(",", ":"))
+    extent_at = header_line.index(f'"{CJSON_SEQ_EXTENT_PLACEHOLDER}"')
+    extent_width = CJSON_SEQ_EXTENT_WIDTH + 2
+    header_line = header_line.replace(
+        f'"{CJSON_SEQ_EXTENT_PLACEHOLDER}"', "[" + " " * CJSON_SEQ_EXTENT_WIDTH + "]"
+    )
+
+    extent_min = np.full(3, np.inf)
+    extent_max = np.full(3, -np.inf)
+    with open(config.output_file, "wb") as outfile:
+        outfile.write(header_line.encode() + b"\n")
+
+        for identifier, city_object, vertices, _ in _iter_city_objects(
+            buildings, surface_array, surface_affine, lod, config, roofs=roofs, cache=cache
+        ):
+            vertices_as_array = np.array(vertices)
+            extent_min = np.minimum(extent_min, vertices_as_array.min(axis=0))
+            extent_max = np.maximum(extent_max, vertices_as_array.max(axis=0))
+
+            feature_vertices, index_map = _quantize_vertices(
+                vertices_as_array, translate, scale
+            )
+            _remap_city_object(city_object, index_map)
+            feature = {
+                "type": "CityJSONFeature",
+                "id": identifier,
+                "CityObjects": {identifier: city_object},
+                "vertices": feature_vertices,
+            }
+            outfile.write(json.dumps(feature, separators=(",", ":")).encode() + b"\n")
+
+        if np.all(np.isfinite(extent_min)):
+            header["metadata"]["geographicalExtent"] = [
+                *extent_min.tolist(),
+                *extent_max.tolist(),
+            ]
+            extent = json.dumps(header["metadata"]["geographicalExtent"])
+            # a pipe cannot be rewound, the header then keeps an empty extent
+            if outfile.seekable() and len(extent) <= extent_width:
+                outfile.seek(extent_at)
+                outfile.write(extent.ljust(extent_width).encode())
+        else:
+            header["metadata"]["geographicalExtent"] = []
+
+    print(f"saved as {config.output_file}")
+    return header
+
+
+def _quantize_vertices(
+    vertices: np.ndarray, translate: np.ndarray, scale: np.ndarray
+) -> Tuple[List[List[int]], List[int]]:
+    """Quantize vertices to integers and merge the ones that become equal.
+    Returns the unique vertices, in order of first use, and the new index
+    of every original vertex."""
+    quantized = np.rint((vertices - translate) / scale).astype(np.int64)
+    unique, first_index, inverse = np.unique(
+        quantized, axis=0, return_index=True, return_inverse=True
+    )
+    # np.unique sorts, put the vertices back in order of first use
+    order = np.argsort(first_index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return unique[order].tolist(), rank[inverse.reshape(-1)].tolist()
+
+
+def _remap_boundaries(boundaries: List, index_map: List[int]) -> List:
+    if boundaries and not isinstance(boundaries[0], list):
+        return [index_map[vertex] for vertex in boundaries]
+    return [_remap_boundaries(boundary, index_map) for boundary in boundaries]
+
+
+def _remap_city_object(city_object: Dict, index_map: List[int]) -> None:
+    for geometry in city_object["geometry"]:
+        geometry["boundaries"] = _remap_boundaries(geometry["boundaries"], index_map)
+
+
+def _iter_city_objects(
+    buildings: fiona.collection,
+    surface_array: Union[np.ndarray, WindowedRaster, SharedRaster],
+    surface_affine: rasterio.Affine,
+    lod: int,
+    config: Py3dModelConfig,
+    vertices: Optional[List[List[float]]] = None,
+    roofs: Optional[Tuple] = None,
+    cache: Optional[BuildingCache] = None,
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    """Create 3D Model per building, yielding each CityObject as it is built.
+    Vertices are appended to ``vertices`` when given, otherwise every
+    building gets its own vertex list and local vertex indices.
+    ``roofs`` are the roof segments and their index for LOD2, buildings found
+    in ``cache`` are reused instead of generated."""
+    if config.workers > 1:
+        yield from _iter_city_objects_parallel(
+            buildings, surface_array, surface_affine, lod, config, vertices, roofs, cache
+        )
+        return
+
     dem_file: Optional[rasterio.DatasetReader] = None
     if config.input_dem is not None:
         dem_file = rasterio.open(config.input_dem)
-        dem = {"array": dem_file.read(1), "affine": dem_file.transform}
+        dem = {"array": _open_raster(dem_file, config), "affine": dem_file.transform}
     else:
         dem = {"array": None, "affine": None}
 
-    vertices: List[List[float]] = []
-    building_vertex_count: Dict[str, List[int]] = {}
-    for building in tqdm(buildings, desc="Building"):
+    surface = {"array": surface_array, "affine": surface_affine}
+
+    try:
+        for chunk in _chunked(tqdm(buildings, desc="Building"), config.chunk_size):
+            chunk = _prepare_chunk(chunk, roofs)
+            if cache is None:
+                yield from _create_chunk(chunk, surface, dem, lod, config, vertices)
+                continue
+
+            keys, cached = _lookup_chunk(chunk, cache, surface, dem, config)
+            created = _create_chunk(
+                [building for building, key in zip(chunk, keys) if key not in cached],
+                surface,
+                dem,
+                lod,
+                config,
+            )
+            yield from _merge_cached_chunk(chunk, keys, cached, created, cache, vertices)
+        _finish_cache(cache)
+    finally:
+        if dem_file is not None:
+            dem_file.close()
+
+
+def _create_chunk(
+    chunk: List[Dict],
+    surface: Dict,
+    dem: Dict,
+    lod: int,
+    config: Py3dModelConfig,
+    vertices: Optional[List[List[float]]] = None,
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    if not chunk:
+        return
+
+    # drape the whole chunk at once, every building then takes its own rings
+    draped_rings = _drape_linear_rings(
+        [
+            linear_ring[:-1]
+            for building in chunk
+            for linear_ring in building["geometry"]["coordinates"]
+        ],
+        surface,
+        dem,
+        config.mode,
+        config.radius,
+    )
+
+    if lod == 2:
+        yield from _create_roof_chunk(chunk, draped_rings, surface, lod, config, vertices)
+        return
+
+    ring_index = 0
+    for building in chunk:
+        ring_count = len(building["geometry"]["coordinates"])
         (
-            vertices,
+            building_vertices,
             building_data,
             vertex_count,
             inner_wall,
         ) = _create_building_per_layer(
             BuildingConfigPerLayer(
-                vertices=vertices,
+                vertices=[] if vertices is None else vertices,
                 identifier=building["properties"]["uuid_bgn"],
                 building_geometry=building["geometry"]["coordinates"],
-                surface={"array": surface_array, "affine": surface_affine},
+                surface=surface,
                 radius=config.radius,
                 dem=dem,
                 mode=config.mode,
+                draped_rings=draped_rings[ring_index : ring_index + ring_count],
             )
         )
-        building_vertex_count = {**building_vertex_count, **vertex_count}
-        if config.building_type == "MultiSurface" and not inner_wall.geometry:
-            pass
-
-        elif config.building_type == "Solid" and not inner_wall.geometry:
-            building_data.geometry = [building_data.geometry]
-            building_data.material = [building_data.material]
-            building_data.semantic = [building_data.semantic]
-
-        elif config.building_type == "MultiSurface" and inner_wall.geometry:
-            building_data.geometry += inner_wall.geometry
-            building_data.semantic += inner_wall.semantic
-            building_data.material += inner_wall.material
-
-        elif config.building_type == "Solid" and inner_wall.geometry:
-            building_data.geometry = [
-                building_data.geometry,
-                inner_wall.geometry,
-            ]
+        ring_index += ring_count
 
-            building_data.material = [
-                building_data.material,
-                inner_wall.material,
-            ]
+        yield (
+            building["properties"]["uuid_bgn"],
+            _create_city_object(building, building_data, inner_wall, lod, config),
+            building_vertices,
+            vertex_count,
+        )
 
-            building_data.semantic = [
-                building_data.semantic,
-                inner_wall.semantic,
-            ]
 
-        else:
-            raise ValueError("Undefined or unsupported building type")
+def _create_roof_chunk(
+    chunk: List[Dict],
+    draped_rings: List[Tuple[np.ndarray, np.ndarray]],
+    surface: Dict,
+    lod: int,
+    config: Py3dModelConfig,
+    vertices: Optional[List[List[float]]] = None,
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    """Create LOD2 buildings from their roof segments, roof planes of the
+    whole chunk are fitted in one batch"""
+    footprints = [shape(building["geometry"]) for building in chunk]
+    building_segments = [
+        split_roof_segments(footprint, building["roof_segments"])
+        for footprint, building in zip(footprints, chunk)
+    ]
 
-        
-        cityjson["CityObjects"][building["properties"]["uuid_bgn"]] = {
-            "type": "Building",
-            "attributes": dict(building["properties"]),
-            "geometry": [
-                {
-                    "type": config.building_type,
-                    "boundaries": building_data.geometry,
-                    "semantics": {
-                        "values": building_data.semantic,
-                        "surfaces": CJSON_SURFACE,
-                    },
-                    "material": {"": {"values": building_data.material}},
-                    "lod": lod,
-                }
-            ],
+    # the exterior ring heights of LOD1 are used where no pixel is found
+    exterior_rings = []
+    ring_index = 0
+    for building in chunk:
+        exterior_rings.append(draped_rings[ring_index])
+        ring_index += len(building["geometry"]["coordinates"])
+    planes = fit_roof_planes(
+        building_segments,
+        surface,
+        np.array([top[0, 2] for top, _ in exterior_rings]),
+    )
+
+    for building, footprint, segments, plane, (_, bottom) in zip(
+        chunk, footprints, building_segments, planes, exterior_rings
+    ):
+        building_vertices = [] if vertices is None else vertices
+        first_vertex = len(building_vertices)
+        building_data = create_roof_building(
+            building_vertices, footprint, segments, plane, bottom[0, 2]
+        )
+        inner_wall = BuildingSurface(geometry=[], semantic=[], material=[])
+
+        yield (
+            building["properties"]["uuid_bgn"],
+            _create_city_object(building, building_data, inner_wall, lod, config),
+            building_vertices,
+            {building["properties"]["uuid_bgn"]: [first_vertex, len(building_vertices)]},
+        )
+
+
+def _iter_city_objects_parallel(
+    buildings: fiona.collection,
+    surface_array: Union[WindowedRaster, SharedRaster],
+    surface_affine: rasterio.Affine,
+    lod: int,
+    config: Py3dModelConfig,
+    vertices: Optional[List[List[float]]] = None,
+    roofs: Optional[Tuple] = None,
+    cache: Optional[BuildingCache] = None,
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    """Reconstruct chunks of buildings in worker processes. Chunks are merged
+    back in input order, so the output is the same as the sequential run."""
+    with ExitStack() as cleanup:
+        dem_spec = None
+        dem = {"array": None, "affine": None}
+        if config.input_dem is not None:
+            dem_file = cleanup.enter_context(rasterio.open(config.input_dem))
+            dem_array = _open_raster(dem_file, config)
+            cleanup.callback(_close_raster, dem_array)
+            dem_spec = _raster_spec(dem_array, dem_file.transform, config.input_dem)
+            dem = {"array": _local_array(dem_array), "affine": dem_file.transform}
+        surface_spec = _raster_spec(surface_array, surface_affine, config.input_surface)
+        surface = {"array": _local_array(surface_array), "affine": surface_affine}
+
+        # cached buildings are merged one by one, workers then return local vertices
+        shared_vertices = vertices is not None and cache is None
+        pool = cleanup.enter_context(
+            multiprocessing.Pool(
+                config.workers,
+                initializer=_init_worker,
+                initargs=(surface_spec, dem_spec, lod, config, shared_vertices),
+            )
+        )
+
+        # keep a bounded number of chunks in flight
+        pending = deque()
+        for chunk in _chunked(tqdm(buildings, desc="Building"), config.chunk_size):
+            chunk = _prepare_chunk(chunk, roofs)
+            lookup = None
+            if cache is not None:
+                keys, cached = _lookup_chunk(chunk, cache, surface, dem, config)
+                lookup = (chunk, keys, cached)
+                chunk = [building for building, key in zip(chunk, keys) if key not in cached]
+            pending.append((lookup, pool.apply_async(_create_chunk_in_worker, (chunk,))))
+            if len(pending) >= 2 * config.workers:
+                yield from _collect_chunk(*pending.popleft(), cache, vertices)
+        while pending:
+            yield from _collect_chunk(*pending.popleft(), cache, vertices)
+        _finish_cache(cache)
+
+
+def _local_array(
+    raster: Union[WindowedRaster, SharedRaster]
+) -> Union[np.ndarray, WindowedRaster]:
+    return raster.array if isinstance(raster, SharedRaster) else raster
+
+
+def _collect_chunk(
+    lookup: Optional[Tuple[List[Dict], List[str], Dict]],
+    result: Any,
+    cache: Optional[BuildingCache],
+    vertices: Optional[List[List[float]]],
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    if lookup is None:
+        yield from _merge_chunk(result.get(), vertices)
+    else:
+        yield from _merge_cached_chunk(*lookup, result.get(), cache, vertices)
+
+
+def _lookup_chunk(
+    chunk: List[Dict], cache: BuildingCache, surface: Dict, dem: Dict, config: Py3dModelConfig
+) -> Tuple[List[str], Dict]:
+    keys = [cache.building_key(building, surface, dem, config.radius) for building in chunk]
+    return keys, cache.get(keys)
+
+
+def _merge_cached_chunk(
+    chunk: List[Dict],
+    keys: List[str],
+    cached: Dict,
+    created: Iterable[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]],
+    cache: BuildingCache,
+    vertices: Optional[List[List[float]]],
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    """Yield the buildings of a chunk in input order, reusing the cached ones
+    and storing the created ones, which come with local vertex indices"""
+    created = iter(created)
+    used = set()
+    for building, key in zip(chunk, keys):
+        identifier = building["properties"]["uuid_bgn"]
+        if key in cached:
+            entry = cached[key]
+            # identical buildings share one entry, the merge below modifies it
+            city_object, building_vertices, vertex_count = (
+                copy.deepcopy(entry) if key in used else entry
+            )
+            used.add(key)
+            city_object["attributes"] = dict(building["properties"])
+        else:
+            _, city_object, building_vertices, vertex_count = next(created)
+            vertex_count = vertex_count[identifier]
+            cache.put(key, city_object, building_vertices, vertex_count)
+
+        if vertices is not None:
+            offset = len(vertices)
+            vertices += building_vertices
+            _remap_city_object(city_object, range(offset, offset + len(building_vertices)))
+            vertex_count = [index + offset for index in vertex_count]
+            building_vertices = vertices
+        yield identifier, city_object, building_vertices, {identifier: vertex_count}
+
+
+def _finish_cache(cache: Optional[BuildingCache]) -> None:
+    if cache is not None:
+        cache.prune()
+        print(f"reused {cache.hits} cached buildings, generated {cache.misses}")
+
+
+def _prepare_chunk(chunk: List, roofs: Optional[Tuple]) -> List[Dict]:
+    """Copy features to plain dicts that can be sent to worker processes,
+    with their roof segments attached for LOD2"""
+    chunk = [
+        {
+            "properties": dict(building["properties"]),
+            "geometry": {
+                "type": building["geometry"]["type"],
+                "coordinates": building["geometry"]["coordinates"],
+            },
         }
+        for building in chunk
+    ]
+    if roofs is not None:
+        footprints = [shape(building["geometry"]) for building in chunk]
+        for building, roof_segments in zip(
+            chunk, assign_roof_segments(footprints, *roofs)
+        ):
+            building["roof_segments"] = roof_segments
+    return chunk
 
-    if config.input_dem is not None:
-        dem_file.close()
 
-    return building_vertex_count, vertices, cityjson
+def _raster_spec(
+    raster: Union[WindowedRaster, SharedRaster], affine: rasterio.Affine, path: str
+) -> Tuple:
+    if isinstance(raster, SharedRaster):
+        return ("shared", raster.spec(), affine)
+    return ("windowed", path, affine)
 
 
-def _get_building_coordinate(
-    linear_ring: List[List[float]], config: BuildingConfigPerLayer
-) -> Tuple[List[List[float]], List[List[float]]]:
-    # create top vertices and bottom vertices
-    building_top_coordinates = [
-        DRAPE_MODE[config.mode](
-            building_coordinate,
-            config.surface["array"],
-            config.surface["affine"],
-            config.surface["affine"][0],
-            config.radius,
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(
+    surface_spec: Tuple,
+    dem_spec: Optional[Tuple],
+    lod: int,
+    config: Py3dModelConfig,
+    shared_vertices: bool,
+) -> None:
+    # every worker gets an equal share of the windowed cache ceiling
+    config = replace(config, workers=1, raster_memory=config.raster_memory / config.workers)
+    _WORKER["rasters"] = []
+    _WORKER["surface"] = _attach_raster(surface_spec, config)
+    _WORKER["dem"] = (
+        {"array": None, "affine": None}
+        if dem_spec is None
+        else _attach_raster(dem_spec, config)
+    )
+    _WORKER["lod"] = lod
+    _WORKER["config"] = config
+    _WORKER["shared_vertices"] = shared_vertices
+
+
+def _attach_raster(spec: Tuple, config: Py3dModelConfig) -> Dict:
+    access, source, affine = spec
+    if access == "shared":
+        raster = SharedRaster(*source[1:], name=source[0])
+        # keep the mapping alive for the lifetime of the worker
+        _WORKER["rasters"].append(raster)
+        return {"array": raster.array, "affine": affine}
+    dataset = rasterio.open(source)
+    _WORKER["rasters"].append(dataset)
+    return {"array": _open_raster(dataset, config), "affine": affine}
+
+
+def _create_chunk_in_worker(
+    chunk: List[Dict],
+) -> List[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    # with shared vertices, the chunk is indexed from zero and rebased when merged
+    vertices = [] if _WORKER["shared_vertices"] else None
+    return list(
+        _create_chunk(
+            chunk,
+            _WORKER["surface"],
+            _WORKER["dem"],
+            _WORKER["lod"],
+            _WORKER["config"],
+            vertices,
         )
-        for building_coordinate in linear_ring
-    ]
-    building_bottom_coordinates = [
-        [building_coordinate[0], building_coordinate[1], 0]
-        if config.dem["array"] is None
-        else DRAPE_MODE[config.mode](
-            building_coordinate,
-            config.dem["array"],
-            config.dem["affine"],
-            config.dem["affine"][0],
-            config.radius,
+    )
+
+
+def _merge_chunk(
+    results: List[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]],
+    vertices: Optional[List[List[float]]],
+) -> Iterator[Tuple[str, Dict, List[List[float]], Dict[str, List[int]]]]:
+    if vertices is None or not results:
+        yield from results
+        return
+
+    # every building of the chunk refers to the same chunk vertex list
+    chunk_vertices = results[0][2]
+    offset = len(vertices)
+    index_map = list(range(offset, offset + len(chunk_vertices)))
+    vertices += chunk_vertices
+    for identifier, city_object, _, vertex_count in results:
+        _remap_city_object(city_object, index_map)
+        yield (
+            identifier,
+            city_object,
+            vertices,
+            {key: [index + offset for index in value] for key, value in vertex_count.items()},
         )
-        for building_coordinate in linear_ring
-    ]
 
-    # average of building height
-    mean_building_top_z = np.average(np.array(building_top_coordinates)[:, 2])
-    building_top_coordinates = [
-        [xyz[0], xyz[1], mean_building_top_z] for xyz in building_top_coordinates
-    ]
 
-    if config.dem["array"] is not None:
-        mean_building_bottom_z = np.average(np.array(building_bottom_coordinates)[:, 2])
-        building_bottom_coordinates = [
-            [xyz[0], xyz[1], mean_building_bottom_z]
-            for xyz in building_bottom_coordinates
+def _chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _create_city_object(
+    building: Dict,
+    building_data: BuildingSurface,
+    inner_wall: BuildingSurface,
+    lod: int,
+    config: Py3dModelConfig,
+) -> Dict:
+    if config.building_type == "MultiSurface" and not inner_wall.geometry:
+        pass
+
+    elif config.building_type == "Solid" and not inner_wall.geometry:
+        building_data.geometry = [building_data.geometry]
+        building_data.material = [building_data.material]
+        building_data.semantic = [building_data.semantic]
+
+    elif config.building_type == "MultiSurface" and inner_wall.geometry:
+        building_data.geometry += inner_wall.geometry
+        building_data.semantic += inner_wall.semantic
+        building_data.material += inner_wall.material
+
+    elif config.building_type == "Solid" and inner_wall.geometry:
+        building_data.geometry = [
+            building_data.geometry,
+            inner_wall.geometry,
         ]
 
-    return building_top_coordinates, building_bottom_coordinates
+        building_data.material = [
+            building_data.material,
+            inner_wall.material,
+        ]
+
+        building_data.semantic = [
+            building_data.semantic,
+            inner_wall.semantic,
+        ]
+
+    else:
+        raise ValueError("Undefined or unsupported building type")
+
+    return {
+        "type": "Building",
+        "attributes": dict(building["properties"]),
+        "geometry": [
+            {
+                "type": config.building_type,
+                "boundaries": building_data.geometry,
+                "semantics": {
+                    "values": building_data.semantic,
+                    "surfaces": CJSON_SURFACE,
+                },
+                "material": {"": {"values": building_data.material}},
+                "lod": lod,
+            }
+        ],
+    }
+
+
+def _drape_linear_rings(
+    linear_rings: List[List[List[float]]],
+    surface: Dict,
+    dem: Dict,
+    mode: str,
+    radius: Optional[float],
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Drape every linear ring in one vectorized pass"""
+    ring_sizes = np.array([len(linear_ring) for linear_ring in linear_rings])
+    ring_starts = np.concatenate(([0], np.cumsum(ring_sizes)[:-1]))
+    coords = np.concatenate(
+        [np.asarray(linear_ring, dtype=np.float64)[:, :2] for linear_ring in linear_rings]
+    )
+
+    # create top vertices and bottom vertices
+    drape = DRAPE_BATCH_MODE[mode]
+    top_coordinates = drape(
+        coords, surface["array"], surface["affine"], surface["affine"][0], radius
+    )
+    if dem["array"] is None:
+        bottom_coordinates = np.column_stack((coords, np.zeros(len(coords))))
+    else:
+        bottom_coordinates = drape(
+            coords, dem["array"], dem["affine"], dem["affine"][0], radius
+        )
+
+    # average of building height per linear ring
+    top_coordinates[:, 2] = np.repeat(
+        np.add.reduceat(top_coordinates[:, 2], ring_starts) / ring_sizes, ring_sizes
+    )
+    if dem["array"] is not None:
+        bottom_coordinates[:, 2] = np.repeat(
+            np.add.reduceat(bottom_coordinates[:, 2], ring_starts) / ring_sizes,
+            ring_sizes,
+        )
+
+    split_at = ring_starts[1:]
+    return list(
+        zip(np.split(top_coordinates, split_at), np.split(bottom_coordinates, split_at))
+    )
 
 
 def _create_building_per_layer(
@@ -290,14 +872,19 @@ def _create_building_per_layer(
     building = BuildingSurface(geometry=[], semantic=[], material=[])
     wall = BuildingSurface(geometry=[], semantic=[], material=[])
 
-    for i, linear_ring in enumerate(config.building_geometry):
-        linear_ring = linear_ring[:-1]
-        # create top vertices and bottom vertices
+    draped_rings = config.draped_rings
+    if draped_rings is None:
+        draped_rings = _drape_linear_rings(
+            [linear_ring[:-1] for linear_ring in config.building_geometry],
+            config.surface,
+            config.dem,
+            config.mode,
+            config.radius,
+        )
 
-        (
-            building_top_coordinates,
-            building_bottom_coordinates,
-        ) = _get_building_coordinate(linear_ring, config)
+    for i, (top_coordinates, bottom_coordinates) in enumerate(draped_rings):
+        building_top_coordinates = top_coordinates.tolist()
+        building_bottom_coordinates = bottom_coordinates.tolist()
 
         vertices += building_top_coordinates
         vertices += building_bottom_coordinates
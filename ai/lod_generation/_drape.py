@@ -13,6 +13,25 @@ def _calc_row_col(x: float, y: float, affine: Affine) -> Tuple[int, int]:
     return int(col), int(row)
 
 
+def _calc_rows_cols(coords: np.ndarray, affine: Affine) -> Tuple[np.ndarray, np.ndarray]:
+    # same operation order as ``Affine.__mul__`` so the truncated pixel
+    # indices match ``_calc_row_col`` exactly
+    inverse = ~affine
+    x, y = coords[:, 0], coords[:, 1]
+    cols = x * inverse.a + y * inverse.b + inverse.c
+    rows = x * inverse.d + y * inverse.e + inverse.f
+    return rows.astype(np.int64), cols.astype(np.int64)
+
+
+def _kernel_mid(res_sp: float, radius: float = None) -> int:
+    kernel_size = int((radius / res_sp) * 2) if radius is not None else 9
+    if radius is not None and kernel_size <= 1:
+        raise ValueError(
+            f"Radius of ${radius} must be 3 times than ${res_sp} of spatial resolution"
+        )
+    return (kernel_size - 1) // 2
+
+
 def todsm(
     coord: List[float], dsm_array: np.ndarray, affine: Affine, *args
 ) -> Tuple[float, float, float]:
@@ -69,18 +88,126 @@ def todsm_onedge(
     #     raise ValueError("Don't use multi type geometry")
 
     x, y = coord[0], coord[1]
-    kernel_size = int((radius / res_sp) * 2) if radius is not None else 9
-    if radius is not None and kernel_size <= 1:
-        raise ValueError(
-            f"Radius of ${radius} must be 3 times than ${res_sp} of spatial resolution"
-        )
-    mid = (kernel_size - 1) // 2
+    mid = _kernel_mid(res_sp, radius)
     col, row = _calc_row_col(x, y, affine)
     kernel = dsm_array[row - mid : row + mid + 1, col - mid : col + mid + 1]
 
     return (x, y, np.max(kernel))
 
+
+def _sample_cells(
+    dsm_array: np.ndarray, rows: np.ndarray, cols: np.ndarray, *args
+) -> np.ndarray:
+    draped_z = dsm_array[rows, cols].astype(np.float64)
+    draped_z[~(draped_z > -32767)] = 0.0
+    return draped_z
+
+
+def _sample_window_max(
+    dsm_array: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    mid: int,
+    chunk_size: int = 65536,
+) -> np.ndarray:
+    height, width = dsm_array.shape
+    size = 2 * mid + 1
+    draped_z = np.empty(len(rows), dtype=np.float64)
+
+    # windows fully inside the raster are gathered from a strided view,
+    # the few touching the border fall back to a clipped slice
+    inside = (
+        (rows - mid >= 0)
+        & (rows + mid < height)
+        & (cols - mid >= 0)
+        & (cols + mid < width)
+    )
+    inside_idx = np.flatnonzero(inside)
+    if inside_idx.size and height >= size and width >= size:
+        windows = np.lib.stride_tricks.sliding_window_view(dsm_array, (size, size))
+        for start in range(0, inside_idx.size, chunk_size):
+            idx = inside_idx[start : start + chunk_size]
+            kernels = windows[rows[idx] - mid, cols[idx] - mid]
+            draped_z[idx] = kernels.max(axis=(1, 2))
+
+    for i in np.flatnonzero(~inside):
+        row, col = rows[i], cols[i]
+        kernel = dsm_array[
+            max(row - mid, 0) : row + mid + 1, max(col - mid, 0) : col + mid + 1
+        ]
+        draped_z[i] = np.max(kernel)
+
+    return draped_z
+
+
+def _read_cells(
+    dsm_array: Any,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    mid: int,
+    sampler: Callable[..., np.ndarray],
+) -> np.ndarray:
+    # in-memory arrays are sampled directly, windowed rasters read the tiles
+    # the vertices fall in
+    if isinstance(dsm_array, np.ndarray):
+        return sampler(dsm_array, rows, cols, mid)
+    return dsm_array.sample(rows, cols, mid, sampler)
+
+
+def todsm_batch(
+    coords: np.ndarray, dsm_array: np.ndarray, affine: Affine, *args
+) -> np.ndarray:
+    """Drape many vertices to dsm at once, vectorized version of ``todsm``
+
+    Arguments:
+        coords {np.ndarray} -- (N, 2) array of x, y coordinates
+        dsm_array {np.ndarray | WindowedRaster} -- surface raster
+        affine {Affine} -- affine transform of the surface raster
+
+    Returns:
+        np.ndarray -- (N, 3) array of draped x, y, z
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    rows, cols = _calc_rows_cols(coords, affine)
+    draped_z = _read_cells(dsm_array, rows, cols, 0, _sample_cells)
+    return np.column_stack((coords[:, 0], coords[:, 1], draped_z))
+
+
+def todsm_onedge_batch(
+    coords: np.ndarray,
+    dsm_array: np.ndarray,
+    affine: Affine,
+    res_sp: float,
+    radius: float = None,
+) -> np.ndarray:
+    """Drape many vertices to building edges at once, vectorized version of
+    ``todsm_onedge``
+
+    Arguments:
+        coords {np.ndarray} -- (N, 2) array of x, y coordinates
+        dsm_array {np.ndarray | WindowedRaster} -- surface raster
+        affine {Affine} -- affine transform of the surface raster
+        res_sp {float} -- spatial resolution of the surface raster
+
+    Keyword Arguments:
+        radius {float} -- search radius around each vertex (default: {None})
+
+    Returns:
+        np.ndarray -- (N, 3) array of draped x, y, z
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    mid = _kernel_mid(res_sp, radius)
+    rows, cols = _calc_rows_cols(coords, affine)
+    draped_z = _read_cells(dsm_array, rows, cols, mid, _sample_window_max)
+    return np.column_stack((coords[:, 0], coords[:, 1], draped_z))
+
+
 DRAPE_MODE: Dict[str, Callable[[Any], Tuple[float, float, float]]] = {
     "normal": todsm,
     "onedge": todsm_onedge,
 }
+
+DRAPE_BATCH_MODE: Dict[str, Callable[[Any], np.ndarray]] = {
+    "normal": todsm_batch,
+    "onedge": todsm_onedge_batch,
+}
@@ -0,0 +1,161 @@
+"""
+Windowed and shared access to surface rasters.
+Only the tiles touched by building vertices are read, and they are kept in a
+bounded LRU cache so memory follows the working set instead of the raster size.
+Whole rasters can also be placed in shared memory for worker processes.
+"""
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+def _tile_size(block_size: int, raster_size: int, target: int = 512) -> int:
+    # grow small native blocks (e.g. single row strips) to a whole number of
+    # blocks, and cap wide strips so one tile never spans the whole raster
+    if block_size < target:
+        block_size *= -(-target // block_size)
+    return max(min(block_size, target * 4, raster_size), 1)
+
+
+class WindowedRaster:
+    """First band of a raster, read tile by tile through a bounded LRU cache
+
+    Arguments:
+        dataset {rasterio.DatasetReader} -- opened raster, must stay open while sampling
+
+    Keyword Arguments:
+        max_memory {float} -- cache ceiling in MB (default: {512})
+    """
+
+    def __init__(self, dataset: rasterio.DatasetReader, max_memory: float = 512):
+        self.dataset = dataset
+        self.shape = (dataset.height, dataset.width)
+        block_rows, block_cols = dataset.block_shapes[0]
+        self.tile_rows = _tile_size(block_rows, dataset.height)
+        self.tile_cols = _tile_size(block_cols, dataset.width)
+        self.tile_count_cols = -(-dataset.width // self.tile_cols)
+        self.max_bytes = int(max_memory * 1024 * 1024)
+
+        self._cache: "OrderedDict[Tuple[int, int, int], Tuple[np.ndarray, int, int]]"
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def sample(
+        self,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        mid: int,
+        sampler: Callable[[np.ndarray, np.ndarray, np.ndarray, int], np.ndarray],
+    ) -> np.ndarray:
+        """Apply ``sampler`` to the cells at ``rows``, ``cols`` tile by tile.
+        Every tile is read with a halo of ``mid`` cells so windowed samplers
+        see the same neighbourhood as on the whole array."""
+        height, width = self.shape
+        if rows.size and (
+            rows.min() < 0 or rows.max() >= height or cols.min() < 0 or cols.max() >= width
+        ):
+            raise ValueError("Building vertices fall outside of the surface extent")
+
+        values = np.empty(len(rows), dtype=np.float64)
+
+        # group the vertices by the tile they fall in
+        tile_keys = (rows // self.tile_rows) * self.tile_count_cols + cols // self.tile_cols
+        order = np.argsort(tile_keys, kind="stable")
+        keys, starts = np.unique(tile_keys[order], return_index=True)
+        for key, idx in zip(keys, np.split(order, starts[1:])):
+            tile_row, tile_col = divmod(int(key), self.tile_count_cols)
+            array, row_off, col_off = self._read_tile(tile_row, tile_col, mid)
+            values[idx] = sampler(array, rows[idx] - row_off, cols[idx] - col_off, mid)
+
+        return values
+
+    def _read_tile(self, tile_row: int, tile_col: int, halo: int) -> Tuple[np.ndarray, int, int]:
+        key = (tile_row, tile_col, halo)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        height, width = self.shape
+        row_off = max(tile_row * self.tile_rows - halo, 0)
+        col_off = max(tile_col * self.tile_cols - halo, 0)
+        row_stop = min((tile_row + 1) * self.tile_rows + halo, height)
+        col_stop = min((tile_col + 1) * self.tile_cols + halo, width)
+        array = self.dataset.read(
+            1, window=Window(col_off, row_off, col_stop - col_off, row_stop - row_off)
+        )
+
+        self._cache[key] = (array, row_off, col_off)
+        self._cache_bytes += array.nbytes
+        # always keep the tile that was just read
+        while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+            _, (evicted, _, _) = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+
+        return self._cache[key]
+
+    def read(self, row_start: int, row_stop: int, col_start: int, col_stop: int) -> np.ndarray:
+        """Read a window directly, bypassing the tile cache"""
+        return self.dataset.read(
+            1, window=Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+        )
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._cache_bytes = 0
+
+
+def read_window(
+    raster, row_start: int, row_stop: int, col_start: int, col_stop: int
+) -> Tuple[np.ndarray, int, int]:
+    """Read the cells of a window clipped to the raster extent from an array
+    or a ``WindowedRaster``, with the row and column offset of the result"""
+    height, width = raster.shape
+    row_start, col_start = max(row_start, 0), max(col_start, 0)
+    row_stop, col_stop = min(row_stop, height), min(col_stop, width)
+    if row_stop <= row_start or col_stop <= col_start:
+        return np.empty((0, 0)), row_start, col_start
+    if isinstance(raster, np.ndarray):
+        return raster[row_start:row_stop, col_start:col_stop], row_start, col_start
+    return raster.read(row_start, row_stop, col_start, col_stop), row_start, col_start
+
+
+class SharedRaster:
+    """First band of a raster held in shared memory, so worker processes map
+    the same array instead of receiving a pickled copy
+
+    Arguments:
+        shape {Tuple[int, int]} -- raster height and width
+        dtype {str} -- numpy dtype of the band
+
+    Keyword Arguments:
+        name {str} -- attach to an existing block instead of creating one (default: {None})
+    """
+
+    def __init__(self, shape: Tuple[int, int], dtype: str, name: Optional[str] = None):
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self._owner = name is None
+        self._memory = shared_memory.SharedMemory(
+            name=name, create=self._owner, size=max(size, 1)
+        )
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._memory.buf)
+
+    @classmethod
+    def from_dataset(cls, dataset: rasterio.DatasetReader) -> "SharedRaster":
+        raster = cls((dataset.height, dataset.width), dataset.dtypes[0])
+        dataset.read(1, out=raster.array)
+        return raster
+
+    def spec(self) -> Tuple[str, Tuple[int, int], str]:
+        """Arguments for ``SharedRaster`` to attach from another process"""
+        return self._memory.name, self.array.shape, self.array.dtype.str
+
+    def close(self) -> None:
+        # the buffer can only be released once no array points to it
+        self.array = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
@@ -0,0 +1,402 @@
+"""
+LOD2 roof reconstruction.
+Roof structure polygons are assigned to their building, a plane is fitted to the
+surface pixels under every roof segment, and the building is closed with walls
+from the ground up to the roof planes and between roof segments of different
+height.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import fiona
+import numpy as np
+import shapely
+from rasterio import Affine
+from rasterio.features import rasterize
+from shapely.geometry import Polygon, shape
+from shapely.geometry.polygon import orient
+
+from ._raster import read_window
+from .interface import BuildingSurface
+
+# remainders of the footprint not covered by roof segments smaller than this
+# (in squared map units) are numerical dust and are dropped
+MIN_SEGMENT_AREA = 1e-4
+# fitted planes steeper than this slope (rise over run) come from mixed
+# roof and ground pixels, those segments fall back to a flat roof
+MAX_ROOF_SLOPE = 3.0
+# distance under which a roof edge is considered to lie on the footprint
+EDGE_TOLERANCE = 1e-3
+# height difference under which two roof planes are considered stitched
+HEIGHT_TOLERANCE = 1e-3
+
+
+def load_roof_segments(input_roof: str, epsg: int) -> Tuple[np.ndarray, shapely.STRtree]:
+    """Read roof structure polygons and index them spatially"""
+    with fiona.open(input_roof) as roofs:
+        roof_epsg = roofs.crs.to_epsg()
+        if roof_epsg != epsg:
+            error_msg = f"Different ref. system : roof epsg:${roof_epsg} and vector epsg:${epsg}"
+            raise ValueError(error_msg)
+
+        geometries = []
+        for roof in roofs:
+            geometry = shape(roof["geometry"])
+            # multipart roof structures are split into their segments
+            geometries += list(getattr(geometry, "geoms", [geometry]))
+
+    geometries = np.array(
+        [geometry for geometry in geometries if isinstance(geometry, Polygon)], dtype=object
+    )
+    return geometries, shapely.STRtree(geometries)
+
+
+def assign_roof_segments(
+    footprints: List[Polygon], roof_geometries: np.ndarray, roof_tree: shapely.STRtree
+) -> List[List[Polygon]]:
+    """Assign every roof segment to the footprint containing its representative
+    point, so a segment overlapping two buildings belongs to one of them"""
+    assigned: List[List[Polygon]] = [[] for _ in footprints]
+    if not len(footprints) or not len(roof_geometries):
+        return assigned
+
+    footprints = np.array(footprints, dtype=object)
+    building_idx, roof_idx = roof_tree.query(footprints, predicate="intersects")
+    points = shapely.point_on_surface(roof_geometries[roof_idx])
+    inside = shapely.contains(footprints[building_idx], points)
+    for building, roof in zip(building_idx[inside], roof_idx[inside]):
+        assigned[building].append(roof_geometries[roof])
+    return assigned
+
+
+def split_roof_segments(footprint: Polygon, roof_segments: List[Polygon]) -> List[Polygon]:
+    """Clip the roof segments to the footprint and fill what they leave
+    uncovered, so the segments tile the whole footprint"""
+    segments: List[Polygon] = []
+    for clipped in shapely.intersection(
+        np.array(roof_segments, dtype=object), footprint
+    ).tolist():
+        segments += _polygons(clipped)
+
+    uncovered = footprint.difference(shapely.union_all(segments)) if segments else footprint
+    segments += _polygons(uncovered)
+    return [orient(segment, sign=1.0) for segment in segments]
+
+
+def _polygons(geometry) -> List[Polygon]:
+    parts = getattr(geometry, "geoms", [geometry])
+    return [
+        part
+        for part in parts
+        if isinstance(part, Polygon) and not part.is_empty and part.area > MIN_SEGMENT_AREA
+    ]
+
+
+def fit_roof_planes(
+    building_segments: List[List[Polygon]], surface: Dict, fallback_z: np.ndarray
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Fit z = a * (x - x0) + b * (y - y0) + c to the surface pixels under every
+    roof segment. Pixel sums are gathered per building with one rasterize call,
+    then the normal equations of every segment are solved in one batch.
+
+    Returns, per building, the (k, 2) plane origins and (k, 3) coefficients.
+    """
+    affine: Affine = surface["affine"]
+    sums = []
+    origins = []
+    fallback = []
+    for segments, building_z in zip(building_segments, fallback_z):
+        origin = np.array([segment.centroid.coords[0] for segment in segments]).reshape(-1, 2)
+        origins.append(origin)
+        fallback.append(np.full(len(segments), building_z))
+        sums.append(_segment_sums(segments, origin, surface["array"], affine))
+
+    sums = np.concatenate(sums) if sums else np.zeros((0, 9))
+    fallback = np.concatenate(fallback) if fallback else np.zeros(0)
+    n, sx, sy, sz, sxx, sxy, syy, sxz, syz = sums.T
+
+    # flat roof at the mean height, or the building height without pixels
+    coefficients = np.zeros((len(sums), 3))
+    coefficients[:, 2] = np.where(n > 0, sz / np.maximum(n, 1), fallback)
+
+    normal_matrix = np.stack(
+        [
+            np.stack([sxx, sxy, sx], axis=-1),
+            np.stack([sxy, syy, sy], axis=-1),
+            np.stack([sx, sy, n], axis=-1),
+        ],
+        axis=1,
+    )
+    normal_vector = np.stack([sxz, syz, sz], axis=-1)
+    solvable = (n >= 3) & (np.abs(np.linalg.det(normal_matrix)) > 1e-9)
+    if np.any(solvable):
+        solved = np.linalg.solve(
+            normal_matrix[solvable], normal_vector[solvable][..., None]
+        )[..., 0]
+        plausible = np.all(np.abs(solved[:, :2]) <= MAX_ROOF_SLOPE, axis=1)
+        coefficients[np.flatnonzero(solvable)[plausible]] = solved[plausible]
+
+    planes = []
+    start = 0
+    for origin in origins:
+        stop = start + len(origin)
+        planes.append((origin, coefficients[start:stop]))
+        start = stop
+    return planes
+
+
+def _segment_sums(
+    segments: List[Polygon], origin: np.ndarray, raster, affine: Affine
+) -> np.ndarray:
+    """Per segment n, sum x, y, z, xx, xy, yy, xz, yz of the pixels under it,
+    with x and y relative to the segment origin"""
+    sums = np.zeros((len(segments), 9))
+    if not segments:
+        return sums
+
+    minx, miny, maxx, maxy = shapely.total_bounds(np.array(segments, dtype=object))
+    inverse = ~affine
+    cols, rows = zip(
+        *[inverse * corner for corner in ((minx, miny), (minx, maxy), (maxx, miny), (maxx, maxy))]
+    )
+    array, row_off, col_off = read_window(
+        raster,
+        int(np.floor(min(rows))),
+        int(np.ceil(max(rows))) + 1,
+        int(np.floor(min(cols))),
+        int(np.ceil(max(cols))) + 1,
+    )
+    if not array.size:
+        return sums
+
+    window_affine = affine * Affine.translation(col_off, row_off)
+    labels = rasterize(
+        [(segment, i + 1) for i, segment in enumerate(segments)],
+        out_shape=array.shape,
+        transform=window_affine,
+        fill=0,
+        dtype="int32",
+    )
+    z = array.astype(np.float64)
+    rows, cols = np.nonzero((labels > 0) & (z > -32767) & np.isfinite(z))
+    if not rows.size:
+        return sums
+
+    label = labels[rows, cols] - 1
+    # pixel centres
+    x = window_affine.a * (cols + 0.5) + window_affine.b * (rows + 0.5) + window_affine.c
+    y = window_affine.d * (cols + 0.5) + window_affine.e * (rows + 0.5) + window_affine.f
+    dx = x - origin[label, 0]
+    dy = y - origin[label, 1]
+    z = z[rows, cols]
+
+    for i, weights in enumerate(
+        (np.ones_like(z), dx, dy, z, dx * dx, dx * dy, dy * dy, dx * z, dy * z)
+    ):
+        sums[:, i] = np.bincount(label, weights=weights, minlength=len(segments))
+    return sums
+
+
+def create_roof_building(
+    vertices: List[List[float]],
+    footprint: Polygon,
+    segments: List[Polygon],
+    plane: Tuple[np.ndarray, np.ndarray],
+    bottom_z: float,
+) -> BuildingSurface:
+    """Create ground, roof and wall surfaces of one LOD2 building.
+    Corners shared by several surfaces are stored once in ``vertices``."""
+    origins, coefficients = plane
+    building = BuildingSurface(geometry=[], semantic=[], material=[])
+    vertex_index: Dict[Tuple[float, float, float], int] = {}
+
+    def add_vertex(x: float, y: float, z: float) -> int:
+        key = (round(x, 6), round(y, 6), round(z, 6))
+        if key not in vertex_index:
+            vertex_index[key] = len(vertices)
+            vertices.append([x, y, z])
+        return vertex_index[key]
+
+    # heights of the points where two adjacent roof planes cross, shared by both
+    ridge_z: Dict[Tuple[float, float], float] = {}
+
+    def plane_z(segment: int, x: float, y: float) -> float:
+        a, b, c = coefficients[segment]
+        return float(a * (x - origins[segment, 0]) + b * (y - origins[segment, 1]) + c)
+
+    def roof_z(segment: int, x: float, y: float) -> float:
+        ridge = ridge_z.get((round(x, 6), round(y, 6)))
+        return plane_z(segment, x, y) if ridge is None else ridge
+
+    def crossing(i: int, j: int, p: np.ndarray, q: np.ndarray) -> Optional[Tuple[float, float]]:
+        # computed in the same order from both sides, so both rings get the same point
+        (xa, ya), (xb, yb) = sorted([tuple(p), tuple(q)])
+        low, high = min(i, j), max(i, j)
+        step_a = plane_z(low, xa, ya) - plane_z(high, xa, ya)
+        step_b = plane_z(low, xb, yb) - plane_z(high, xb, yb)
+        if min(step_a, step_b) > -HEIGHT_TOLERANCE or max(step_a, step_b) < HEIGHT_TOLERANCE:
+            return None
+        t = step_a / (step_a - step_b)
+        x, y = xa + t * (xb - xa), ya + t * (yb - ya)
+        ridge_z[(round(x, 6), round(y, 6))] = plane_z(low, x, y)
+        return x, y
+
+    def add_surface(rings: List[List[int]], semantic: int, material: int) -> None:
+        building.geometry.append(rings)
+        building.semantic.append(semantic)
+        building.material.append(material)
+
+    # every corner of the footprint and the segments is inserted into the
+    # edges it lies on, so the surfaces meeting at an edge share its vertices
+    footprint = orient(footprint, sign=1.0)
+    corners = np.unique(
+        np.concatenate(
+            [
+                np.asarray(ring.coords)[:, :2]
+                for polygon in [footprint, *segments]
+                for ring in [polygon.exterior, *polygon.interiors]
+            ]
+        ),
+        axis=0,
+    )
+
+    # ground surface faces down
+    add_surface(
+        [
+            [add_vertex(x, y, bottom_z) for x, y in _insert_vertices(ring, corners)[:-1]][::-1]
+            for ring in [footprint.exterior, *footprint.interiors]
+        ],
+        1,
+        0,
+    )
+
+    footprint_boundary = footprint.boundary
+    segment_tree = shapely.STRtree(segments)
+    for i, segment in enumerate(segments):
+        rings = []
+        for ring in [segment.exterior, *segment.interiors]:
+            coords = _insert_vertices(ring, corners)
+            start, end = coords[:-1], coords[1:]
+            # the segment lies on the left of its edges, probe on the right
+            direction = end - start
+            length = np.maximum(np.hypot(direction[:, 0], direction[:, 1]), 1e-12)
+            probe = (start + end) / 2 + np.column_stack((direction[:, 1], -direction[:, 0])) / length[:, None] * 0.01
+            neighbours = _neighbour_segments(segment_tree, i, probe)
+
+            # an edge where the neighbouring plane crosses this one is split at
+            # the crossing, each part is then closed by the higher segment
+            points, edge_neighbours = [coords[0]], []
+            for p, q, neighbour in zip(start, end, neighbours):
+                ridge = crossing(i, neighbour, p, q) if neighbour >= 0 else None
+                if ridge is not None:
+                    points.append(ridge)
+                    edge_neighbours.append(neighbour)
+                points.append(q)
+                edge_neighbours.append(neighbour)
+            rings.append((np.array(points, dtype=np.float64), edge_neighbours))
+
+        # roof surface faces up
+        add_surface(
+            [[add_vertex(x, y, roof_z(i, x, y)) for x, y in coords[:-1]] for coords, _ in rings],
+            0,
+            0,
+        )
+
+        for coords, neighbours in rings:
+            start, end = coords[:-1], coords[1:]
+            on_footprint = (
+                shapely.distance(footprint_boundary, shapely.points((start + end) / 2)) < EDGE_TOLERANCE
+            )
+
+            for (x1, y1), (x2, y2), on_edge, neighbour in zip(start, end, on_footprint, neighbours):
+                top_1, top_2 = roof_z(i, x1, y1), roof_z(i, x2, y2)
+                if on_edge or neighbour < 0:
+                    base_1 = base_2 = bottom_z
+                else:
+                    base_1, base_2 = roof_z(neighbour, x1, y1), roof_z(neighbour, x2, y2)
+                    # the higher segment closes the step, flush edges need no wall
+                    step_1, step_2 = top_1 - base_1, top_2 - base_2
+                    if min(step_1, step_2) <= -HEIGHT_TOLERANCE or max(step_1, step_2) < HEIGHT_TOLERANCE:
+                        continue
+
+                # wall surface faces away from the segment, a triangle where
+                # it ends at a ridge point
+                wall = [
+                    add_vertex(x1, y1, base_1),
+                    add_vertex(x2, y2, base_2),
+                    add_vertex(x2, y2, top_2),
+                    add_vertex(x1, y1, top_1),
+                ]
+                add_surface(
+                    [[index for k, index in enumerate(wall) if index != wall[k - 1]]],
+                    2,
+                    1,
+                )
+
+    _stitch_wall_sides(building, vertex_index)
+    return building
+
+
+def _stitch_wall_sides(
+    building: BuildingSurface, vertex_index: Dict[Tuple[float, float, float], int]
+) -> None:
+    """Walls meeting at a corner can end at different heights, insert into
+    every vertical wall side the vertices of the other surfaces lying on it"""
+    corner_heights: Dict[Tuple[float, float], List[Tuple[float, int]]] = {}
+    keys = {}
+    for key, index in vertex_index.items():
+        corner_heights.setdefault(key[:2], []).append((key[2], index))
+        keys[index] = key
+
+    for surface, semantic in zip(building.geometry, building.semantic):
+        if semantic != 2:
+            continue
+        ring = surface[0]
+        stitched = []
+        for start, end in zip(ring, ring[1:] + ring[:1]):
+            stitched.append(start)
+            (x, y, z_start), z_end = keys[start], keys[end][2]
+            if (x, y) != keys[end][:2]:
+                continue
+            low, high = min(z_start, z_end), max(z_start, z_end)
+            between = sorted(
+                (z, index) for z, index in corner_heights[(x, y)] if low < z < high
+            )
+            stitched += [index for _, index in (between if z_start < z_end else between[::-1])]
+        surface[0] = stitched
+
+
+def _insert_vertices(ring, corners: np.ndarray) -> np.ndarray:
+    """Closed (n, 2) coordinates of ``ring`` with the corners lying inside its
+    edges inserted in order along them"""
+    coords = np.asarray(ring.coords)[:, :2]
+    start, direction = coords[:-1], coords[1:] - coords[:-1]
+    length = np.maximum(np.hypot(direction[:, 0], direction[:, 1]), 1e-12)
+    relative = corners[None, :, :] - start[:, None, :]
+    # position along and distance from every edge, in map units
+    along = (relative * direction[:, None, :]).sum(axis=2) / length[:, None]
+    across = np.abs(relative[..., 0] * direction[:, None, 1] - relative[..., 1] * direction[:, None, 0]) / length[:, None]
+    inside = (
+        (across < EDGE_TOLERANCE)
+        & (along > EDGE_TOLERANCE)
+        & (along < length[:, None] - EDGE_TOLERANCE)
+    )
+    if not inside.any():
+        return coords
+
+    inserted = [coords[:1]]
+    for edge in range(len(start)):
+        on_edge = np.flatnonzero(inside[edge])
+        inserted.append(corners[on_edge[np.argsort(along[edge, on_edge])]])
+        inserted.append(coords[edge + 1 : edge + 2])
+    return np.concatenate(inserted)
+
+
+def _neighbour_segments(segment_tree: shapely.STRtree, exclude: int, probes: np.ndarray) -> np.ndarray:
+    """Lowest index of a segment other than ``exclude`` containing every probe
+    point, -1 where there is none"""
+    probe_idx, segment_idx = segment_tree.query(shapely.points(probes), predicate="within")
+    other = segment_idx != exclude
+    neighbours = np.full(len(probes), np.iinfo(np.int64).max)
+    np.minimum.at(neighbours, probe_idx[other], segment_idx[other])
+    neighbours[neighbours == np.iinfo(np.int64).max] = -1
+    return neighbours
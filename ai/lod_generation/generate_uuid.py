@@ -1,7 +1,71 @@
-from uuid import uuid4
+import os
+import shutil
+import tempfile
+from hashlib import blake2b
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
 import fiona
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import shape
 from tqdm.autonotebook import tqdm
 
+# features read, identified and written per batch
+UUID_BATCH_SIZE = 10000
+
+
+def uuid4_hex(count: int) -> np.ndarray:
+    """Generate ``count`` random version 4 UUIDs as 32 character hex strings"""
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    # version 4 and RFC 4122 variant bits, as uuid.uuid4
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return np.frombuffer(raw.tobytes().hex().encode(), dtype="S32").astype(str)
+
+
+def hash_hex(geometries: np.ndarray, seen: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """Content hashed ids, stable between runs: the blake2b digest of every
+    geometry WKB. Repeated geometries are told apart by their occurrence,
+    counted in ``seen`` across batches."""
+    seen = {} if seen is None else seen
+    ids = []
+    for wkb in shapely.to_wkb(geometries).tolist():
+        identifier = blake2b(wkb, digest_size=16).hexdigest()
+        occurrence = seen.get(identifier, 0)
+        seen[identifier] = occurrence + 1
+        if occurrence:
+            identifier = blake2b(
+                wkb + occurrence.to_bytes(8, "little"), digest_size=16
+            ).hexdigest()
+        ids.append(identifier)
+    return np.array(ids, dtype=str)
+
+
+def _generate_ids(
+    id_type: str, positions: np.ndarray, geometries: Optional[np.ndarray], seen: Dict[str, int]
+) -> List:
+    if id_type == "uuid":
+        return uuid4_hex(len(positions)).tolist()
+    if id_type == "hash":
+        return hash_hex(geometries, seen).tolist()
+    return positions.tolist()
+
+
+def _is_missing(value) -> bool:
+    # NaN is the only value not equal to itself
+    return value is None or value != value or len(str(value)) == 0
+
+
+def _batched(iterable: Iterable, size: int) -> Iterable[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 def generate_uuid(
     input_file: str,
@@ -10,38 +74,102 @@ def generate_uuid(
     driver: str = None,
     id_type: str = "uuid",
     overwrite: bool = False,
+    batch_size: int = UUID_BATCH_SIZE,
 ) -> None:
-    with fiona.Env(), fiona.open(input_file) as src:
-        out_schema = src.schema.copy()
-        if fieldname not in src.schema["properties"].keys():
-            out_schema["properties"][fieldname] = "str:32"
-        output_file = input_file if output_file is None else output_file
-        driver = src.driver if driver is None else driver
-        crs = src.crs
-        out_dicts = [src_dict for src_dict in src]
-
-    with fiona.open(
-        output_file,
-        "w",
-        driver=driver,
-        schema=out_schema,
-        crs=crs,
-    ) as out:
-        for i, out_dict in enumerate(tqdm(out_dicts, "Generating UUID")):
-            if fieldname not in out_dict["properties"].keys():
-                out_dict["properties"][fieldname] = (
-                    uuid4().hex if id_type == "uuid" else i
+    """Write ``input_file`` with an id field to ``output_file`` (the input
+    itself by default). Features are streamed in batches, ``id_type`` is
+    "uuid" (random), "hash" (stable content hash of the geometry) or anything
+    else for the feature index."""
+    output_file = os.path.abspath(input_file if output_file is None else output_file)
+    output_dir = os.path.dirname(output_file)
+    in_place = output_file == os.path.abspath(input_file)
+    # the input cannot be read while it is rewritten, stream to a temporary
+    # directory and move the result (with its sidecar files) over it
+    temp_dir = tempfile.mkdtemp(dir=output_dir) if in_place else None
+    target = os.path.join(temp_dir, os.path.basename(output_file)) if in_place else output_file
+
+    try:
+        with fiona.Env(), fiona.open(input_file) as src:
+            out_schema = src.schema.copy()
+            if fieldname not in src.schema["properties"].keys():
+                out_schema["properties"][fieldname] = (
+                    "str:32" if id_type in ("uuid", "hash") else "int"
                 )
-            else:
-                if overwrite:
-                    out_dict["properties"][fieldname] = (
-                        uuid4().hex if id_type == "uuid" else i
-                    )
-                elif (
-                    len(out_dict["properties"][fieldname]) == 0
-                    or out_dict["properties"][fieldname] is None
+            driver = src.driver if driver is None else driver
+            has_field = fieldname in src.schema["properties"].keys()
+            seen: Dict[str, int] = {}
+
+            with fiona.open(
+                target,
+                "w",
+                driver=driver,
+                schema=out_schema,
+                crs=src.crs,
+            ) as out:
+                start = 0
+                for batch in _batched(
+                    tqdm(src, "Generating UUID", total=len(src)), batch_size
                 ):
-                    out_dict["properties"][fieldname] = (
-                        uuid4().hex if id_type == "uuid" else i
+                    properties = [dict(feature["properties"]) for feature in batch]
+                    if has_field and not overwrite:
+                        missing = np.array(
+                            [
+                                i
+                                for i, feature_properties in enumerate(properties)
+                                if _is_missing(feature_properties.get(fieldname))
+                            ],
+                            dtype=np.int64,
+                        )
+                    else:
+                        missing = np.arange(len(batch))
+
+                    if missing.size:
+                        geometries = (
+                            np.array([shape(batch[i]["geometry"]) for i in missing], dtype=object)
+                            if id_type == "hash"
+                            else None
+                        )
+                        ids = _generate_ids(id_type, start + missing, geometries, seen)
+                        for i, identifier in zip(missing.tolist(), ids):
+                            properties[i][fieldname] = identifier
+
+                    out.writerecords(
+                        fiona.Feature(
+                            geometry=feature.geometry,
+                            properties=fiona.Properties.from_dict(feature_properties),
+                        )
+                        for feature, feature_properties in zip(batch, properties)
                     )
-            out.write(out_dict)
+                    start += len(batch)
+
+        if in_place:
+            for name in os.listdir(temp_dir):
+                os.replace(os.path.join(temp_dir, name), os.path.join(output_dir, name))
+    finally:
+        if in_place:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def assign_uuid(
+    gdf: gpd.GeoDataFrame,
+    fieldname: str = "uuid",
+    id_type: str = "uuid",
+    overwrite: bool = False,
+) -> gpd.GeoDataFrame:
+    """Same as ``generate_uuid`` on a GeoDataFrame in memory, ids are
+    generated for every row, or only for the missing ones unless ``overwrite``"""
+    gdf = gdf.copy()
+    if fieldname in gdf.columns and not overwrite:
+        missing = np.array([_is_missing(value) for value in gdf[fieldname].tolist()], dtype=bool)
+    else:
+        missing = np.ones(len(gdf), dtype=bool)
+
+    ids = _generate_ids(
+        id_type, np.flatnonzero(missing), np.asarray(gdf.geometry.values[missing]), {}
+    )
+    if missing.all():
+        gdf[fieldname] = ids
+    else:
+        gdf[fieldname] = gdf[fieldname].astype(object)
+        gdf.loc[missing, fieldname] = ids
+    return gdf
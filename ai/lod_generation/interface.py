@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import rasterio
@@ -17,6 +17,30 @@ class Py3dModelConfig:
     input_dem: Optional[str] = None
     building_type: str = "MultiSurface"
     texture: Optional[Dict] = None
+    # "full" reads the whole surface/dem, "windowed" reads only the tiles
+    # touched by buildings
+    raster_access: str = "full"
+    # memory ceiling in MB for the windowed tile cache, shared by surface and dem
+    raster_memory: float = 512
+    # "cityjson" writes one document at the end, "cityjsonseq" streams
+    # CityJSON Text Sequences while buildings are created
+    output_format: str = "cityjson"
+    # buildings draped per vectorized pass
+    chunk_size: int = 10000
+    # write CityJSON 1.1 integer vertices with this "transform" scale (e.g.
+    # 0.001 for millimetres) and merge duplicated vertices, None keeps floats
+    vertex_scale: Optional[float] = None
+    # worker processes reconstructing chunks of buildings, 1 runs in-process
+    workers: int = 1
+    # the runners write the singlepart buildings with their uuid back to
+    # input_building, False keeps the input untouched and only writes the model
+    update_input: bool = True
+    # building ids given by the runners, "uuid" (random), "hash" (content hash
+    # of the geometry, stable between runs) or anything else for the row index
+    id_type: str = "uuid"
+    # SQLite sidecar of generated buildings, reruns only generate the
+    # buildings whose outline, roof or raster cells changed, None disables it
+    cache_file: Optional[str] = None
 
 
 @dataclass
@@ -30,6 +54,8 @@ class BuildingConfigPerLayer:
     radius: float
     dem: Dict[str, Union[np.ndarray, rasterio.Affine]]
     mode: str
+    # top and bottom coordinates per linear ring, already draped
+    draped_rings: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
 
 
 @dataclass
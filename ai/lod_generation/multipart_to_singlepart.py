@@ -1,10 +1,6 @@
-
 import geopandas as gpd
 
-def multipart_to_singlepart(input_file, output_file):
-    # Read input file
-    gdf = gpd.read_file(input_file)
-
+def explode_buildings(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     # Drop the existing 'level_1' column if it exists
     if 'level_1' in gdf.columns:
         # gdf.set_index('level_1', inplace=True)
@@ -14,9 +10,15 @@ def multipart_to_singlepart(input_file, output_file):
         gdf = gdf.drop(columns=['level_0'])
 
     # Convert multipart to singlepart
-    singlepart_gdf = gdf.explode(index_parts=True)
+    return gdf.explode(index_parts=True)
+
+def multipart_to_singlepart(input_file, output_file):
+    # Read input file
+    gdf = gpd.read_file(input_file)
+
+    singlepart_gdf = explode_buildings(gdf)
 
     # Save the result to output file
     singlepart_gdf.to_file(output_file)
 
-    print("Singlepart file created successfully:", output_file)
\ No newline at end of file
+    print("Singlepart file created successfully:", output_file)
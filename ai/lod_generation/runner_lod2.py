@@ -1,8 +1,9 @@
 from ._cityjson import create_model
-from .multipart_to_singlepart import multipart_to_singlepart
-from .generate_uuid import generate_uuid
+from .multipart_to_singlepart import explode_buildings
+from .generate_uuid import assign_uuid
 from .interface import Py3dModelConfig
 
+import geopandas as gpd
 from PyQt5 import QtCore
 
 class GenerateLOD2(QtCore.QThread):
@@ -22,13 +23,15 @@ class GenerateLOD2(QtCore.QThread):
             self.progress.emit("Generating LOD 2", 0)
 
             self.progress.emit("Convert Multipart to Singlepart", 10)
-            multipart_to_singlepart(self.config.input_building, self.config.input_building)
+            buildings = explode_buildings(gpd.read_file(self.config.input_building))
 
             self.progress.emit("Generate UUID", 20)
-            generate_uuid(self.config.input_building, fieldname="uuid_bgn", id_type="uuid", overwrite=True)
-            
+            buildings = assign_uuid(buildings, fieldname="uuid_bgn", id_type=self.config.id_type, overwrite=True)
+            if self.config.update_input:
+                buildings.to_file(self.config.input_building)
+
             self.progress.emit("Create model", 50)
-            create_model(self.config)
+            create_model(self.config, buildings)
 
             self.finished.emit("Finished", 100)
         except Exception as e:
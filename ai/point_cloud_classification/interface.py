@@ -8,4 +8,19 @@ class PointCloudClassificationParams:
   features: FeatureOptions = ""
   model: str = ""
   point_cloud_path: str = ""
-  output_path: str = ""
\ No newline at end of file
+  output_path: str = ""
+  # Points predicted at a time, None predicts the whole cloud at once. Does not
+  # bound the neighbourhood features, which are computed over the whole cloud
+  chunk_size: Optional[int] = 1_000_000
+  # Prediction threads of the Random Forest or XGBoost model, None for every core
+  workers: Optional[int] = None
+  # Add height above local minimum, verticality, planarity and linearity to the features,
+  # the model must be trained with them. The first run on a cloud reads all of its
+  # points into one KD-tree: about 100 bytes per point plus 250 MB, whatever the chunk_size
+  neighbourhood_features: bool = False
+  # Directory of the cached neighbourhood features, None for the temporary directory
+  feature_cache_dir: Optional[str] = None
+  # Write the output as a copy of the input with only the classification replaced,
+  # keeping every other dimension (GPS time, returns, ...); otherwise only the
+  # classified features are written, in point format 2
+  copy_source: bool = True
@@ -2,12 +2,15 @@ from PyQt5.QtCore import QObject, pyqtSignal
 from .interface import PointCloudClassificationParams
 from enums.point_cloud_classification import AlgorithmOptions, FeatureOptions
 
+import os
 import time
-import pickle
 import numpy as np
-import laspy
 import xgboost as xgb
 
+from utils.io_las import INTENSITY_DIMENSIONS, RGB_DIMENSIONS, LasCopyWriter, LasResultWriter, iter_las_chunks, read_las_array, read_las_header
+from utils.model_registry import MODEL_REGISTRY, load_classifier
+from utils.point_features import FEATURE_NAMES, cached_point_features
+
 class PointCloudClassification(QObject):
   progress = pyqtSignal(str, int)
   finished = pyqtSignal(str)
@@ -23,60 +26,102 @@ class PointCloudClassification(QObject):
     elif params.features == FeatureOptions.RGB.value:
       self.feat_to_use = [0, 1, 2, 3, 4, 5]
 
-  def read_data(self):
-    lasfile = laspy.read(self.args.point_cloud_path)
-    x = lasfile.x
-    y = lasfile.y
-    z = lasfile.z
-
-    if self.args.features == FeatureOptions.INTENSITY.value:
-      I = lasfile.intensity
-      X_train = np.column_stack((x, y, z, I))
-    elif self.args.features == FeatureOptions.RGB.value:
-      r = lasfile.red
-      g = lasfile.green
-      b = lasfile.blue
-      X_train = np.column_stack((x, y, z, r, g, b))
-    
-    return X_train
-
-  def write_classification(self, X, Y):
-    header = laspy.LasHeader(point_format=2, version="1.2")
-    las = laspy.LasData(header)
-    las.x = X[:, 0]
-    las.y = X[:, 1]
-    las.z = X[:, 2]
+    # neighbourhood features are appended after the point dimensions
+    if params.neighbourhood_features:
+      self.feat_to_use = self.feat_to_use + list(range(len(self.feat_to_use), len(self.feat_to_use) + len(FEATURE_NAMES)))
 
+  def read_data(self):
+    # filled chunk by chunk, without a column_stack copy of the whole cloud
     if self.args.features == FeatureOptions.INTENSITY.value:
-      las.intensity = X[:, 3]
+      return read_las_array(self.args.point_cloud_path, INTENSITY_DIMENSIONS)
     elif self.args.features == FeatureOptions.RGB.value:
-      las.red = X[:, 3]
-      las.green = X[:, 4]
-      las.blue = X[:, 5]
+      return read_las_array(self.args.point_cloud_path, RGB_DIMENSIONS)
 
-    reverse_mapping = {0: 2, 1: 5, 2: 6}
-    # Class: 2 = ground, 5 = vegetation, 6 = building
-    Y = np.array([reverse_mapping[label] for label in Y])
-    Y = np.rint(Y).astype(np.uint8)
-    las.classification = Y[:]
+  def result_writer(self):
+    isIntensity = self.args.features == FeatureOptions.INTENSITY.value
+    # Class: 2 = ground, 5 = vegetation, 6 = building, remapped with CLASS_LUT
+    if self.args.copy_source:
+      return LasCopyWriter(self.args.point_cloud_path, self.args.output_path, isIntensity=isIntensity)
+    return LasResultWriter(self.args.output_path, isIntensity=isIntensity, header=read_las_header(self.args.point_cloud_path))
 
-    ext = 'laz' if self.args.features == FeatureOptions.INTENSITY.value else 'las'
-    las.write(f"{self.args.output_path}.{ext}")
+  def write_classification(self, X, Y):
+    with self.result_writer() as writer:
+      if self.args.copy_source:
+        writer.write(Y)
+      else:
+        writer.write(X, labels=Y)
 
   # xg boost
   def predict_model(self, model, X_test):
     dtest = xgb.DMatrix(data=X_test[:, self.feat_to_use])
     return model.predict(dtest)
+
+  def point_features(self):
+    # computed once per cloud, later runs map them from the cache
+    return cached_point_features(self.args.point_cloud_path, self.args.feature_cache_dir)
+
+  def with_features(self, chunks, features):
+    start = 0
+    for chunk in chunks:
+      yield np.hstack((chunk, features[start:start + len(chunk)]))
+      start += len(chunk)
+
+  def predict_chunks(self, model, chunks):
+    """Predict point chunks in order, yielding every chunk with its labels.
+    The one model loaded through the registry predicts every chunk, on
+    its own threads: the Random Forest trees with joblib, XGBoost in place."""
+    workers = self.args.workers or os.cpu_count() or 1
+
+    if self.args.algorithm == AlgorithmOptions.XG_BOOST.value:
+      model.set_param({'nthread': workers})
+      for chunk in chunks:
+        Y = model.inplace_predict(np.ascontiguousarray(chunk[:, self.feat_to_use]))
+        # class probabilities with multi:softprob
+        yield chunk, Y.argmax(axis=1) if Y.ndim == 2 else Y
+      return
+
+    if hasattr(model, 'n_jobs'):
+      model.n_jobs = workers
+    for chunk in chunks:
+      yield chunk, model.predict(chunk[:, self.feat_to_use])
+
+  def run_chunked(self, model):
+    isIntensity = self.args.features == FeatureOptions.INTENSITY.value
+    dimensions = INTENSITY_DIMENSIONS if isIntensity else RGB_DIMENSIONS
+    point_count = read_las_header(self.args.point_cloud_path).point_count
+
+    # classified chunks are written as they complete
+    with self.result_writer() as writer:
+      done = 0
+      chunks = iter_las_chunks(self.args.point_cloud_path, dimensions, self.args.chunk_size)
+      if self.args.neighbourhood_features:
+        chunks = self.with_features(chunks, self.point_features())
+      for chunk, Y_pred in self.predict_chunks(model, chunks):
+        if self.args.copy_source:
+          writer.write(Y_pred)
+        else:
+          writer.write(chunk, labels=Y_pred)
+        done += len(chunk)
+        self.progress.emit(f'Classified {done}/{point_count} points', 20 + int(done / max(point_count, 1) * 70))
   
   def run(self):
     try:
       start = time.time() 
       
       self.progress.emit('Memuat Model ...', 0)
-      model = pickle.load(open(self.args.model, 'rb'))
+      model = MODEL_REGISTRY.get(self.args.model, load_classifier, kind='point_cloud_classification')
+
+      if self.args.chunk_size:
+        self.progress.emit('Classifying the dataset ...', 20)
+        self.run_chunked(model)
+        end = time.time()
+        self.finished.emit('Data classified in: {}'.format(end - start))
+        return
 
       self.progress.emit('Loading data ...', 10)
       X = self.read_data()
+      if self.args.neighbourhood_features:
+        X = np.hstack((X, self.point_features()))
       
       self.progress.emit('Classifying the dataset ...', 20)
       if self.args.algorithm == AlgorithmOptions.RF.value:
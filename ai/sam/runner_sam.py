@@ -7,6 +7,7 @@ import cv2
 from segment_anything import sam_model_registry, SamAutomaticMaskGenerator, SamPredictor
 import os
 from utils.common import get_root_dir
+from utils.model_registry import MODEL_REGISTRY
 
 class SAM:
   def __init__(self) -> None:
@@ -17,8 +18,12 @@ class SAM:
     device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
     model_type = "vit_h"
 
-    sam = sam_model_registry[model_type](checkpoint=self.model_checkpoint)
-    sam.to(device=device)
+    # loaded once and shared by every SAM instance until its file changes
+    sam = MODEL_REGISTRY.get(
+      self.model_checkpoint,
+      lambda path: sam_model_registry[model_type](checkpoint=path).to(device=device),
+      kind=f"sam/{model_type}/{device}",
+    )
 
     self.predictor = SamPredictor(sam)
 
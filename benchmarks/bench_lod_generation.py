@@ -0,0 +1,271 @@
+"""
+Benchmark of the LOD generation hot path.
+Synthetic building layers and surfaces are generated offline, then every stage
+of ``create_model`` is timed on its own: reading the inputs, draping (batched
+and the per-vertex ``DRAPE_MODE`` on a sample), building the topology,
+serializing the CityJSON, and the whole ``create_model`` run. The RSS of a
+stage is the peak of the process so far, ``--trace-memory`` measures the
+allocations of every stage on its own.
+
+Run from the project root:
+
+    python -m benchmarks.bench_lod_generation --buildings 1000 10000 --resolutions 0.5 0.25
+    python -m benchmarks.bench_lod_generation --compare results_old.json
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import fiona
+import numpy as np
+import rasterio
+
+from ai.lod_generation._cityjson import (
+    CJSON_SCHEMA,
+    _create_building_per_layer,
+    _create_city_object,
+    _drape_linear_rings,
+    _open_raster,
+    _prepare_chunk,
+    create_model,
+)
+from ai.lod_generation._drape import DRAPE_MODE
+from ai.lod_generation.interface import BuildingConfigPerLayer, Py3dModelConfig
+from tests.lod_fixtures import make_fixture
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, None when unknown.
+    It only ever grows, so a stage inherits the peak of the stages before it"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 ** 2
+    return None
+
+
+class StageTimer:
+    """Best wall time over repeats of every stage, with the cumulative peak
+    RSS of the process after it and, when tracing, the peak of the Python
+    and numpy allocations made within the stage"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict[str, Optional[float]]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            result = self.stages.setdefault(name, {"seconds": None})
+            if result["seconds"] is None or seconds < result["seconds"]:
+                result["seconds"] = seconds
+            result["cumulative_peak_rss_mb"] = peak_rss_mb()
+            if self.trace_memory:
+                result["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                tracemalloc.stop()
+
+
+def run_case(
+    fixture: Dict,
+    building_count: int,
+    resolution: float,
+    mode: str,
+    radius: Optional[float],
+    repeat: int,
+    drape_sample: int,
+    trace_memory: bool,
+) -> Dict:
+    timer = StageTimer(trace_memory)
+    config = Py3dModelConfig(
+        input_building=fixture["building"],
+        input_surface=fixture["surface"],
+        input_dem=fixture["dem"],
+        output_file=os.path.join(os.path.dirname(fixture["building"]), "bench.json"),
+        mode=mode,
+        radius=radius,
+    )
+
+    for _ in range(repeat):
+        with timer.stage("read"):
+            with rasterio.open(config.input_surface) as surface_file, rasterio.open(
+                config.input_dem
+            ) as dem_file, fiona.open(config.input_building) as buildings:
+                surface = {"array": _open_raster(surface_file, config), "affine": surface_file.transform}
+                dem = {"array": _open_raster(dem_file, config), "affine": dem_file.transform}
+                features = _prepare_chunk(list(buildings), None)
+
+        rings = [ring[:-1] for feature in features for ring in feature["geometry"]["coordinates"]]
+        with timer.stage("drape"):
+            draped_rings = []
+            for start in range(0, len(rings), config.chunk_size):
+                draped_rings += _drape_linear_rings(
+                    rings[start : start + config.chunk_size], surface, dem, mode, radius
+                )
+
+        sample = [coord for ring in rings[:drape_sample] for coord in ring]
+        drape = DRAPE_MODE[mode]
+        with timer.stage("drape_per_vertex_sample"):
+            for coord in sample:
+                drape(coord, surface["array"], surface["affine"], surface["affine"][0], radius)
+                drape(coord, dem["array"], dem["affine"], dem["affine"][0], radius)
+
+        with timer.stage("topology"):
+            cityjson = copy.deepcopy(CJSON_SCHEMA)
+            vertices: List[List[float]] = []
+            ring_index = 0
+            for feature in features:
+                ring_count = len(feature["geometry"]["coordinates"])
+                _, building_data, _, inner_wall = _create_building_per_layer(
+                    BuildingConfigPerLayer(
+                        vertices=vertices,
+                        identifier=feature["properties"]["uuid_bgn"],
+                        building_geometry=feature["geometry"]["coordinates"],
+                        surface=surface,
+                        radius=radius,
+                        dem=dem,
+                        mode=mode,
+                        draped_rings=draped_rings[ring_index : ring_index + ring_count],
+                    )
+                )
+                ring_index += ring_count
+                cityjson["CityObjects"][feature["properties"]["uuid_bgn"]] = _create_city_object(
+                    feature, building_data, inner_wall, 1, config
+                )
+            cityjson["vertices"] = vertices
+
+        with timer.stage("serialize"):
+            with open(config.output_file, "w") as outfile:
+                json.dump(cityjson, outfile)
+        output_size = os.path.getsize(config.output_file)
+        del cityjson, vertices, draped_rings, surface, dem
+
+        with timer.stage("create_model"):
+            create_model(config)
+
+    return {
+        "buildings": building_count,
+        "resolution": resolution,
+        "raster_size": fixture["raster_size"],
+        "vertices_sampled": len(sample),
+        "output_mb": output_size / 1024 ** 2,
+        "stages": timer.stages,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict) -> None:
+    """Print the time ratio of every stage against an earlier run"""
+    previous = {(case["buildings"], case["resolution"]): case for case in baseline["cases"]}
+    for case in results["cases"]:
+        old = previous.get((case["buildings"], case["resolution"]))
+        if old is None:
+            continue
+        print(f"{case['buildings']} buildings @ {case['resolution']} m vs {baseline.get('commit')}")
+        for name, stage in case["stages"].items():
+            if name in old["stages"]:
+                ratio = stage["seconds"] / max(old["stages"][name]["seconds"], 1e-9)
+                print(f"  {name:<24} {stage['seconds']:9.3f} s  x{ratio:.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark LOD generation stages")
+    parser.add_argument("--buildings", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--resolutions", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--mode", default="onedge", choices=sorted(DRAPE_MODE))
+    parser.add_argument("--radius", type=float, default=None)
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    parser.add_argument(
+        "--drape-sample", type=int, default=1000, help="rings draped vertex by vertex"
+    )
+    parser.add_argument("--trace-memory", action="store_true", help="also trace the peak Python and numpy allocations of every stage")
+    parser.add_argument("--workdir", default=None, help="keep the fixtures here")
+    parser.add_argument("--output", default="bench_lod_generation.json")
+    parser.add_argument("--compare", default=None, help="earlier results to compare against")
+    args = parser.parse_args(argv)
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "mode": args.mode,
+        "radius": args.radius,
+        "repeat": args.repeat,
+        "cases": [],
+    }
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        workdir = tempdir if args.workdir is None else args.workdir
+        os.makedirs(workdir, exist_ok=True)
+        for resolution in args.resolutions:
+            for building_count in args.buildings:
+                fixture = make_fixture(workdir, building_count, resolution)
+                case = run_case(
+                    fixture,
+                    building_count,
+                    resolution,
+                    args.mode,
+                    args.radius,
+                    args.repeat,
+                    args.drape_sample,
+                    args.trace_memory,
+                )
+                results["cases"].append(case)
+                print(json.dumps(case, indent=2))
+
+    with open(args.output, "w") as outfile:
+        json.dump(results, outfile, indent=2)
+    print(f"saved as {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as infile:
+            compare(results, json.load(infile))
+    return results
+
+
+if __name__ == "__main__":
+    main()
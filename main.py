@@ -1,6 +1,7 @@
 import sys 
 import os
 import shutil
+import multiprocessing
 
 from PyQt5.QtWidgets import (
 	QMainWindow, 
@@ -27,6 +28,7 @@ from ui.cityjson_viewer_tab import CityjsonViewerTabWidget
 from enums.layout_type import LayoutType
 
 from utils.common import get_temp_dir
+from utils.model_registry import MODEL_REGISTRY
 
 
 # Creating the main window 
@@ -183,6 +185,10 @@ class MyTabWidget(QWidget):
 			self.tabs.setStyleSheet(default_style)
 
 if __name__ == '__main__': 
+	# worker processes (LOD generation) need this in frozen builds
+	multiprocessing.freeze_support()
 	app = QApplication(sys.argv) 
+	# free the models kept warm between classification runs
+	app.aboutToQuit.connect(MODEL_REGISTRY.clear)
 	ex = App() 
 	sys.exit(app.exec_()) 
\ No newline at end of file
@@ -0,0 +1,9 @@
+import pytest
+
+from tests.lod_fixtures import make_fixture
+
+
+@pytest.fixture(scope="session")
+def lod_inputs(tmp_path_factory):
+    """Building layer, DSM and DTM of 60 synthetic buildings at 0.5 m"""
+    return make_fixture(str(tmp_path_factory.mktemp("lod")), building_count=60, resolution=0.5)
@@ -0,0 +1,87 @@
+"""
+Synthetic LOD generation inputs shared by the tests and the benchmark: a
+building layer on a jittered grid with a matching DSM and DTM.
+"""
+import os
+from typing import Dict, Iterator
+
+import fiona
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+# distance between building centres of the synthetic layer, in metres
+BUILDING_SPACING = 15.0
+# UTM 49S, as the sample data
+BENCH_EPSG = 32749
+BENCH_ORIGIN = (430000.0, 9140000.0)
+# rows of the synthetic rasters written at once
+RASTER_STRIP = 1024
+
+
+def make_fixture(workdir: str, building_count: int, resolution: float, seed: int = 0) -> Dict:
+    """Write a building layer on a jittered grid and a matching DSM and DTM"""
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(building_count)))
+    extent = side * BUILDING_SPACING + 2 * BUILDING_SPACING
+    size = int(np.ceil(extent / resolution))
+    transform = from_origin(*BENCH_ORIGIN, resolution, resolution)
+
+    name = f"{building_count}_{resolution}"
+    surface = os.path.join(workdir, f"dsm_{name}.tif")
+    dem = os.path.join(workdir, f"dtm_{name}.tif")
+    profile = dict(
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs=f"EPSG:{BENCH_EPSG}",
+        transform=transform,
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+    )
+    with rasterio.open(surface, "w", **profile) as dsm, rasterio.open(dem, "w", **profile) as dtm:
+        for row in range(0, size, RASTER_STRIP):
+            rows = min(RASTER_STRIP, size - row)
+            window = Window(0, row, size, rows)
+            ground = rng.random((rows, size), dtype=np.float32) + 2.0
+            dtm.write(ground, 1, window=window)
+            dsm.write(ground + rng.random((rows, size), dtype=np.float32) * 20.0, 1, window=window)
+
+    building = os.path.join(workdir, f"buildings_{name}.shp")
+    schema = {"geometry": "Polygon", "properties": {"uuid_bgn": "str:32"}}
+    with fiona.open(
+        building, "w", driver="ESRI Shapefile", schema=schema, crs=f"EPSG:{BENCH_EPSG}"
+    ) as out:
+        out.writerecords(_synthetic_buildings(building_count, side, rng))
+
+    return {"surface": surface, "dem": dem, "building": building, "raster_size": size}
+
+
+def _synthetic_buildings(building_count: int, side: int, rng: np.random.Generator) -> Iterator[Dict]:
+    for i in range(building_count):
+        row, col = divmod(i, side)
+        cx = BENCH_ORIGIN[0] + (col + 1.5) * BUILDING_SPACING + rng.uniform(-1, 1)
+        cy = BENCH_ORIGIN[1] - (row + 1.5) * BUILDING_SPACING + rng.uniform(-1, 1)
+        w = rng.uniform(2.0, 5.0)
+        exterior = [
+            (cx - w, cy - w),
+            (cx + w, cy - w),
+            (cx + w, cy + w),
+            (cx, cy + 1.5 * w),
+            (cx - w, cy + w),
+            (cx - w, cy - w),
+        ]
+        rings = [exterior]
+        # a courtyard in every tenth building exercises the inner walls
+        if i % 10 == 0:
+            rings.append(
+                [(cx - 1, cy - 1), (cx - 1, cy + 1), (cx + 1, cy + 1), (cx + 1, cy - 1), (cx - 1, cy - 1)]
+            )
+        yield {
+            "geometry": {"type": "Polygon", "coordinates": rings},
+            "properties": {"uuid_bgn": f"{i:032x}"},
+        }
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from utils.dgcnn import partition_blocks
+
+
+def split_array_reference(data, num_blocks_x, num_blocks_y, block_size):
+    # split_array of data_utils/split_merge_las.py before partition_blocks
+    blocks = []
+    min_extent_x = np.min(data[:, 0])
+    min_extent_y = np.min(data[:, 1])
+    for i in range(num_blocks_x):
+        for j in range(num_blocks_y):
+            start_x = min_extent_x + i * block_size
+            end_x = start_x + block_size
+            start_y = min_extent_y + j * block_size
+            end_y = start_y + block_size
+            blocks.append(data[(data[:, 0] >= start_x) & (data[:, 0] < end_x) &
+                               (data[:, 1] >= start_y) & (data[:, 1] < end_y)])
+    return blocks
+
+
+def sorted_rows(points):
+    return points[np.lexsort(points.T[::-1])]
+
+
+def cloud(offset, extent, count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack((
+        offset + rng.random(count) * extent,
+        offset + rng.random(count) * extent,
+        rng.random((count, 4)),
+    ))
+
+
+@pytest.mark.parametrize("offset, extent, block_size", [(430000.0, 100.0, 25.0), (0.0, 10.0, 0.7)])
+def test_partition_blocks_matches_split_array(offset, extent, block_size):
+    data = cloud(offset, extent)
+    blocks = partition_blocks(data, block_size)
+    reference = split_array_reference(data, blocks.num_blocks_x, blocks.num_blocks_y, block_size)
+
+    assert len(blocks) == len(reference)
+    for block, expected in zip(blocks, reference):
+        np.testing.assert_array_equal(block, expected)
+
+
+@pytest.mark.parametrize("block_size, max_extent", [(0.2, 9140003.299999999), (1.1, 9140013.899999999)])
+def test_partition_blocks_keeps_every_point(block_size, max_extent):
+    # projected coordinates whose maximum rounds onto the edge past the last block
+    min_extent = 9140000.7
+    data = cloud(min_extent, max_extent - min_extent, seed=1)
+    data[0, :2] = min_extent
+    data[1, :2] = max_extent
+    data[2, 0] = max_extent
+    blocks = partition_blocks(data, block_size)
+    reference = split_array_reference(data, blocks.num_blocks_x, blocks.num_blocks_y, block_size)
+
+    np.testing.assert_array_equal(sorted_rows(np.concatenate(list(blocks))), sorted_rows(data))
+    assert sorted(blocks.order.tolist()) == list(range(len(data)))
+    # the points split_array keeps are in the same blocks
+    for block, expected in zip(blocks, reference):
+        assert {row.tobytes() for row in expected} <= {row.tobytes() for row in block}
+
+
+def test_partition_blocks_explicit_counts_leave_points_out():
+    data = cloud(430000.0, 100.0)
+    blocks = partition_blocks(data, 25.0, 2, 3)
+    reference = split_array_reference(data, 2, 3, 25.0)
+
+    assert len(blocks) == 6
+    for block, expected in zip(blocks, reference):
+        np.testing.assert_array_equal(block, expected)
+    assert blocks.offsets[-1] < len(data)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from utils.dgcnn import add_vote
+
+
+def add_vote_reference(vote_label_pool, point_idx, pred_label, weight):
+    # add_vote of utils/dgcnn.py before it was vectorized
+    B = pred_label.shape[0]
+    N = pred_label.shape[1]
+    for b in range(B):
+        for n in range(N):
+            if weight[b, n] != 0 and not np.isinf(weight[b, n]):
+                if int(pred_label[b, n]) < vote_label_pool.shape[1]:
+                    vote_label_pool[int(point_idx[b, n]), int(pred_label[b, n])] += 1
+    return vote_label_pool
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_add_vote_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    point_idx = rng.integers(0, 300, (4, 256))
+    # one label past the classes, weights left out when 0 or inf
+    pred_label = rng.integers(0, 4, (4, 256))
+    weight = rng.choice([0.0, 0.5, 1.0, np.inf], (4, 256))
+
+    expected = add_vote_reference(np.zeros((300, 3)), point_idx, pred_label, weight)
+    np.testing.assert_array_equal(add_vote(np.zeros((300, 3)), point_idx, pred_label, weight), expected)
+
+
+def test_add_vote_soft_votes_sum_the_scores():
+    rng = np.random.default_rng(0)
+    point_idx = np.array([[0, 1, 1, 2]])
+    weight = np.array([[1.0, 1.0, 0.0, 1.0]])
+    scores = rng.random((1, 4, 3))
+
+    votes = add_vote(np.zeros((3, 3)), point_idx, None, weight, scores)
+    np.testing.assert_allclose(votes, scores[0][[0, 1, 3]])
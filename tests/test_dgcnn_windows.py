@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from utils.dgcnn import iter_scene_windows, prefetch_batches, whole_scene_windows
+
+
+def normalize(data_batch):
+    data_batch[:, 3:6] /= 255
+
+
+def whole_scene_reference(points, labels, labelweights, block_points, block_size, stride, padding, random):
+    # ScannetDatasetWholeScene.__getitem__ before whole_scene_windows
+    coord_min, coord_max = np.amin(points, axis=0)[:3], np.amax(points, axis=0)[:3]
+    grid_x = int(np.ceil(float(coord_max[0] - coord_min[0] - block_size) / stride) + 1)
+    grid_y = int(np.ceil(float(coord_max[1] - coord_min[1] - block_size) / stride) + 1)
+    data_room, label_room, sample_weight, index_room = np.array([]), np.array([]), np.array([]), np.array([])
+    for index_y in range(0, grid_y):
+        for index_x in range(0, grid_x):
+            s_x = coord_min[0] + index_x * stride
+            e_x = min(s_x + block_size, coord_max[0])
+            s_x = e_x - block_size
+            s_y = coord_min[1] + index_y * stride
+            e_y = min(s_y + block_size, coord_max[1])
+            s_y = e_y - block_size
+            point_idxs = np.where(
+                (points[:, 0] >= s_x - padding) & (points[:, 0] <= e_x + padding)
+                & (points[:, 1] >= s_y - padding) & (points[:, 1] <= e_y + padding))[0]
+            if point_idxs.size == 0:
+                continue
+            num_batch = int(np.ceil(point_idxs.size / block_points))
+            point_size = int(num_batch * block_points)
+            replace = False if (point_size - point_idxs.size <= point_idxs.size) else True
+            point_idxs_repeat = random.choice(point_idxs, point_size - point_idxs.size, replace=replace)
+            point_idxs = np.concatenate((point_idxs, point_idxs_repeat))
+            random.shuffle(point_idxs)
+            data_batch = points[point_idxs, :]
+            normlized_xyz = np.zeros((point_size, 3))
+            normlized_xyz[:, 0] = data_batch[:, 0] / coord_max[0]
+            normlized_xyz[:, 1] = data_batch[:, 1] / coord_max[1]
+            normlized_xyz[:, 2] = data_batch[:, 2] / coord_max[2]
+            data_batch[:, 0] = data_batch[:, 0] - (s_x + block_size / 2.0)
+            data_batch[:, 1] = data_batch[:, 1] - (s_y + block_size / 2.0)
+            normalize(data_batch)
+            data_batch = np.concatenate((data_batch, normlized_xyz), axis=1)
+            label_batch = labels[point_idxs].astype(int)
+            batch_weight = labelweights[label_batch]
+            data_room = np.vstack([data_room, data_batch]) if data_room.size else data_batch
+            label_room = np.hstack([label_room, label_batch]) if label_room.size else label_batch
+            sample_weight = np.hstack([sample_weight, batch_weight]) if label_room.size else batch_weight
+            index_room = np.hstack([index_room, point_idxs]) if index_room.size else point_idxs
+    return (
+        data_room.reshape((-1, block_points, data_room.shape[1])),
+        label_room.reshape((-1, block_points)),
+        sample_weight.reshape((-1, block_points)),
+        index_room.reshape((-1, block_points)),
+    )
+
+
+@pytest.mark.parametrize("stride, block_size", [(25.0, 25.0), (10.0, 25.0), (30.0, 20.0)])
+def test_whole_scene_windows_match_the_old_sampler(stride, block_size):
+    rng = np.random.default_rng(3)
+    count = 20000
+    points = np.column_stack((rng.random((count, 2)) * 120, rng.random(count) * 20, rng.random((count, 3)) * 255))
+    # points on the window edges
+    points[:300, :2] = np.round(points[:300, :2] / 25) * 25
+    labels = rng.integers(0, 3, count).astype(np.float64)
+    labelweights = np.array([1.0, 1.5, 2.0], dtype=np.float32)
+
+    expected = whole_scene_reference(points, labels, labelweights, 512, block_size, stride, 0.001, np.random.RandomState(7))
+    result = whole_scene_windows(
+        points, labels, labelweights, 512, block_size, stride, 0.001, normalize, np.random.RandomState(7)
+    )
+    for array, expected_array in zip(result, expected):
+        assert array.shape == expected_array.shape
+        np.testing.assert_array_equal(array, expected_array)
+
+
+def scene(count=20000, seed=3):
+    rng = np.random.default_rng(seed)
+    points = np.column_stack((rng.random((count, 2)) * 120, rng.random(count) * 20, rng.random((count, 3)) * 255))
+    labels = rng.integers(0, 3, count).astype(np.float64)
+    return points, labels, np.array([1.0, 1.5, 2.0], dtype=np.float32)
+
+
+def test_prefetched_windows_match_the_whole_scene():
+    points, labels, labelweights = scene()
+    args = (points, labels, labelweights, 512, 25.0, 10.0, 0.001, normalize)
+    expected = whole_scene_windows(*args, np.random.default_rng(7))
+
+    windows = list(iter_scene_windows(*args, np.random.default_rng(7)))
+    assert len(windows) > 1
+    for array, expected_array in zip(zip(*windows), expected):
+        np.testing.assert_array_equal(np.concatenate(array), expected_array)
+
+    # batches do not line up with the windows
+    batches = list(prefetch_batches(lambda: iter_scene_windows(*args, np.random.default_rng(7)), 5))
+    assert sum(len(point_index) for _, point_index, _ in batches) == expected[0].shape[0]
+    data, _, smpw, point_index = expected
+    np.testing.assert_array_equal(
+        np.concatenate([batch.numpy() for batch, _, _ in batches]), data.transpose(0, 2, 1).astype(np.float32)
+    )
+    np.testing.assert_array_equal(np.concatenate([index for _, index, _ in batches]), point_index)
+    np.testing.assert_array_equal(np.concatenate([weights for _, _, weights in batches]), smpw)
+
+
+def test_first_batch_is_ready_before_every_window_exists():
+    points, labels, labelweights = scene()
+    released = threading.Event()
+    built = []
+
+    def windows():
+        for window in iter_scene_windows(points, labels, labelweights, 512, 25.0, 10.0, 0.001, normalize):
+            built.append(window)
+            if len(built) == 2:
+                # the rest of the scene waits until the first batch is taken
+                released.wait(timeout=10)
+            yield window
+
+    batches = prefetch_batches(windows, batch_size=1, depth=1)
+    next(batches)
+    assert len(built) <= 2
+    released.set()
+    assert len(list(batches)) > 1
@@ -0,0 +1,115 @@
+import json
+import os
+
+import fiona
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import box, mapping
+
+from ai.lod_generation.generate_uuid import assign_uuid, generate_uuid, hash_hex
+from ai.lod_generation.interface import Py3dModelConfig
+from ai.lod_generation.multipart_to_singlepart import explode_buildings
+
+FEATURE_COUNT = 25
+
+
+@pytest.fixture
+def building_file(tmp_path):
+    path = str(tmp_path / "buildings.shp")
+    schema = {"geometry": "Polygon", "properties": {"name": "str:16"}}
+    with fiona.open(path, "w", driver="ESRI Shapefile", schema=schema, crs="EPSG:32748") as out:
+        for i in range(FEATURE_COUNT):
+            # every fifth building repeats the previous outline
+            offset = i - 1 if i % 5 == 4 else i
+            out.write({
+                "geometry": mapping(box(offset * 10, 0, offset * 10 + 5, 5)),
+                "properties": {"name": f"b{i}"},
+            })
+    return path
+
+
+def read_features(path):
+    with fiona.open(path) as src:
+        return [(dict(feature["properties"]), feature["geometry"]["coordinates"]) for feature in src]
+
+
+def test_hash_ids_tell_duplicate_geometries_apart():
+    geometries = np.array([box(0, 0, 1, 1), box(0, 0, 1, 1), box(2, 0, 3, 1), box(0, 0, 1, 1)], dtype=object)
+
+    ids = hash_hex(geometries)
+
+    assert len(set(ids.tolist())) == len(ids)
+    # occurrences are counted across batches
+    seen = {}
+    np.testing.assert_array_equal(np.concatenate([hash_hex(geometries[:1], seen), hash_hex(geometries[1:], seen)]), ids)
+
+
+@pytest.mark.parametrize("id_type", ["uuid", "hash", "index"])
+def test_batched_output_keeps_every_feature(building_file, tmp_path, id_type):
+    output_file = str(tmp_path / "output.shp")
+    generate_uuid(building_file, output_file, id_type=id_type, batch_size=7)
+
+    written = read_features(output_file)
+    assert [(properties["name"], coords) for properties, coords in written] == [
+        (properties["name"], coords) for properties, coords in read_features(building_file)
+    ]
+    ids = [properties["uuid"] for properties, _ in written]
+    assert len(set(ids)) == FEATURE_COUNT
+    if id_type == "index":
+        assert ids == list(range(FEATURE_COUNT))
+    else:
+        assert all(len(identifier) == 32 for identifier in ids)
+
+
+def test_hash_ids_are_stable_between_runs(building_file, tmp_path):
+    def run(name, **args):
+        output_file = str(tmp_path / f"{name}.shp")
+        generate_uuid(building_file, output_file, id_type="hash", **args)
+        return [properties["uuid"] for properties, _ in read_features(output_file)]
+
+    ids = run("first")
+    assert run("second", batch_size=4) == ids
+    assert assign_uuid(gpd.read_file(building_file), id_type="hash")["uuid"].tolist() == ids
+
+
+def test_in_place_output_replaces_the_input(building_file, tmp_path):
+    before = sorted(os.listdir(tmp_path))
+    generate_uuid(building_file, batch_size=7)
+
+    # the sidecar files are replaced too and the temporary directory removed
+    assert sorted(os.listdir(tmp_path)) == before
+    written = read_features(building_file)
+    assert [properties["name"] for properties, _ in written] == [f"b{i}" for i in range(FEATURE_COUNT)]
+    assert len({properties["uuid"] for properties, _ in written}) == FEATURE_COUNT
+
+
+def test_existing_ids_are_kept_unless_overwritten(building_file, tmp_path):
+    first = str(tmp_path / "first.shp")
+    generate_uuid(building_file, first, batch_size=7)
+    ids = [properties["uuid"] for properties, _ in read_features(first)]
+
+    generate_uuid(first, batch_size=7)
+    assert [properties["uuid"] for properties, _ in read_features(first)] == ids
+    generate_uuid(first, overwrite=True, batch_size=7)
+    assert set(properties["uuid"] for properties, _ in read_features(first)).isdisjoint(ids)
+
+
+def test_runner_uses_the_configured_id_type(lod_inputs, tmp_path):
+    pytest.importorskip("PyQt5")
+    from ai.lod_generation.runner_lod1 import GenerateLOD1
+
+    output_file = str(tmp_path / "model.json")
+    GenerateLOD1(Py3dModelConfig(
+        input_building=lod_inputs["building"],
+        input_surface=lod_inputs["surface"],
+        input_dem=lod_inputs["dem"],
+        output_file=output_file,
+        update_input=False,
+        id_type="hash",
+    )).run()
+
+    with open(output_file) as model:
+        ids = sorted(json.load(model)["CityObjects"])
+    expected = assign_uuid(explode_buildings(gpd.read_file(lod_inputs["building"])), "uuid_bgn", "hash", overwrite=True)
+    assert ids == sorted(expected["uuid_bgn"])
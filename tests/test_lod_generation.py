@@ -0,0 +1,176 @@
+import datetime
+import json
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+
+from ai.lod_generation._cityjson import CJSON_DEFAULT_SCALE, CJSON_SEQ_EXTENT_WIDTH, create_model
+from ai.lod_generation._drape import DRAPE_BATCH_MODE, DRAPE_MODE
+from ai.lod_generation._raster import WindowedRaster
+from ai.lod_generation.interface import Py3dModelConfig
+from ai.lod_generation.multipart_to_singlepart import explode_buildings
+
+
+def drape_coords(dataset, count=2000, margin=5):
+    # inside the raster, far enough from the top and left edges for the
+    # per-vertex kernels, which do not clip negative indices
+    rng = np.random.default_rng(0)
+    affine = dataset.transform
+    cols = rng.uniform(margin, dataset.width, count)
+    rows = rng.uniform(margin, dataset.height, count)
+    return np.column_stack((affine.c + cols * affine.a, affine.f + rows * affine.e))
+
+
+@pytest.mark.parametrize("mode, radius", [("normal", None), ("onedge", None), ("onedge", 1.5)])
+def test_batch_drape_matches_per_vertex(lod_inputs, mode, radius):
+    with rasterio.open(lod_inputs["surface"]) as dataset:
+        array = dataset.read(1)
+        affine = dataset.transform
+        coords = drape_coords(dataset)
+        expected = np.array(
+            [DRAPE_MODE[mode](coord, array, affine, affine[0], radius) for coord in coords.tolist()]
+        )
+
+        np.testing.assert_array_equal(DRAPE_BATCH_MODE[mode](coords, array, affine, affine[0], radius), expected)
+        windowed = WindowedRaster(dataset, max_memory=1)
+        np.testing.assert_array_equal(DRAPE_BATCH_MODE[mode](coords, windowed, affine, affine[0], radius), expected)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"workers": 2, "chunk_size": 7},
+        {"raster_access": "windowed", "raster_memory": 1},
+        {"chunk_size": 13},
+        {"cache": True},
+        {"cache": True, "workers": 2, "raster_access": "windowed"},
+    ],
+)
+def test_lod1_output_is_byte_identical(lod_inputs, tmp_path, options):
+    def run(name, **config):
+        output_file = str(tmp_path / f"{name}.json")
+        create_model(Py3dModelConfig(
+            input_building=lod_inputs["building"],
+            input_surface=lod_inputs["surface"],
+            input_dem=lod_inputs["dem"],
+            output_file=output_file,
+            **config,
+        ))
+        with open(output_file, "rb") as output:
+            return output.read()
+
+    expected = run("default")
+    options = dict(options)
+    if options.pop("cache", False):
+        options["cache_file"] = str(tmp_path / "cache.sqlite")
+        # the second run reads every building from the cache
+        assert run("cold", **options) == expected
+    assert run("options", **options) == expected
+
+
+def model_config(lod_inputs, output_file, **config):
+    return Py3dModelConfig(
+        input_building=lod_inputs["building"],
+        input_surface=lod_inputs["surface"],
+        input_dem=lod_inputs["dem"],
+        output_file=str(output_file),
+        **config,
+    )
+
+
+def coordinates(boundaries, vertices):
+    """Coordinates of every vertex of nested boundaries, in order"""
+    if isinstance(boundaries, int):
+        return [vertices[boundaries]]
+    return [coordinate for boundary in boundaries for coordinate in coordinates(boundary, vertices)]
+
+
+def test_cityjsonseq_round_trips_to_cityjson(lod_inputs, tmp_path):
+    create_model(model_config(lod_inputs, tmp_path / "model.json"))
+    create_model(model_config(lod_inputs, tmp_path / "model.jsonl", output_format="cityjsonseq"))
+
+    with open(tmp_path / "model.json") as model:
+        cityjson = json.load(model)
+    with open(tmp_path / "model.jsonl", "rb") as sequence:
+        lines = sequence.read().split(b"\n")
+    assert lines[-1] == b""
+    header, features = json.loads(lines[0]), [json.loads(line) for line in lines[1:-1]]
+
+    # the extent patched into the header stays within its line
+    assert header["type"] == "CityJSON"
+    assert header["version"] == "1.1"
+    np.testing.assert_allclose(header["metadata"]["geographicalExtent"], cityjson["metadata"]["geographicalExtent"])
+    unpatched = dict(header, metadata=dict(header["metadata"], geographicalExtent=[]))
+    assert len(lines[0]) == len(json.dumps(unpatched, separators=(",", ":"))) + CJSON_SEQ_EXTENT_WIDTH
+
+    scale = np.array(header["transform"]["scale"])
+    translate = np.array(header["transform"]["translate"])
+    assert [feature["id"] for feature in features] == list(cityjson["CityObjects"])
+    for feature in features:
+        assert feature["type"] == "CityJSONFeature"
+        vertices = np.array(feature["vertices"]) * scale + translate
+        city_object = feature["CityObjects"][feature["id"]]
+        expected = cityjson["CityObjects"][feature["id"]]
+        assert city_object["attributes"] == expected["attributes"]
+        assert len(city_object["geometry"]) == len(expected["geometry"])
+        for geometry, expected_geometry in zip(city_object["geometry"], expected["geometry"]):
+            assert geometry["semantics"] == expected_geometry["semantics"]
+            np.testing.assert_allclose(
+                coordinates(geometry["boundaries"], vertices.tolist()),
+                coordinates(expected_geometry["boundaries"], cityjson["vertices"]),
+                atol=CJSON_DEFAULT_SCALE / 2 + 1e-9,
+            )
+
+
+
+def test_quantized_vertices_match_the_float_output(lod_inputs, tmp_path):
+    create_model(model_config(lod_inputs, tmp_path / "float.json"))
+    create_model(model_config(lod_inputs, tmp_path / "quantized.json", vertex_scale=0.001))
+    with open(tmp_path / "float.json") as model:
+        expected = json.load(model)
+    with open(tmp_path / "quantized.json") as model:
+        quantized = json.load(model)
+
+    assert quantized["version"] == "1.1"
+    assert quantized["transform"]["scale"] == [0.001, 0.001, 0.001]
+    np.testing.assert_array_equal(quantized["transform"]["translate"], np.min(expected["vertices"], axis=0))
+    assert all(isinstance(value, int) for vertex in quantized["vertices"] for value in vertex)
+    # shared corners are merged
+    assert len(quantized["vertices"]) <= len(expected["vertices"])
+
+    vertices = (
+        np.array(quantized["vertices"]) * quantized["transform"]["scale"] + quantized["transform"]["translate"]
+    ).tolist()
+    for identifier, city_object in expected["CityObjects"].items():
+        for geometry, quantized_geometry in zip(city_object["geometry"], quantized["CityObjects"][identifier]["geometry"]):
+            np.testing.assert_allclose(
+                coordinates(quantized_geometry["boundaries"], vertices),
+                coordinates(geometry["boundaries"], expected["vertices"]),
+                atol=0.0005 + 1e-9,
+            )
+
+
+def test_buildings_in_memory_have_the_file_attributes(lod_inputs, tmp_path):
+    buildings = explode_buildings(gpd.read_file(lod_inputs["building"]))
+    buildings["surveyed"] = [datetime.date(2024, 1, 1) + datetime.timedelta(days=i) for i in range(len(buildings))]
+    buildings["storeys"] = np.arange(len(buildings), dtype=np.int64) % 4 + 1
+    buildings["area"] = buildings.area.astype(np.float32)
+    building_file = str(tmp_path / "buildings.shp")
+    buildings.to_file(building_file)
+
+    from_file = create_model(model_config(dict(lod_inputs, building=building_file), tmp_path / "file.json"))
+    in_memory = create_model(model_config(lod_inputs, tmp_path / "memory.json"), buildings)
+
+    def attributes(model):
+        return {key: city_object["attributes"] for key, city_object in model["CityObjects"].items()}
+
+    assert attributes(in_memory) == attributes(from_file)
+    first = next(iter(attributes(in_memory).values()))
+    assert first["surveyed"] == "2024-01-01" and {"level_0", "level_1"} <= set(first)
+
+    # timestamps are written as ISO strings
+    buildings["updated"] = buildings["surveyed"].astype("datetime64[ns]")
+    model = create_model(model_config(lod_inputs, tmp_path / "timestamps.json"), buildings)
+    assert next(iter(attributes(model).values()))["updated"] == "2024-01-01T00:00:00"
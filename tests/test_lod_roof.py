@@ -0,0 +1,86 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+from shapely.geometry import Polygon, box
+
+from ai.lod_generation._roof import create_roof_building, split_roof_segments
+
+
+def build(footprint, roof_segments, heights, bottom_z=0.0):
+    segments = split_roof_segments(footprint, roof_segments)
+    origins = np.array([segment.centroid.coords[0] for segment in segments])
+    # flat roofs, at the height of the roof segment containing them
+    coefficients = np.zeros((len(segments), 3))
+    for i, segment in enumerate(segments):
+        point = segment.representative_point()
+        coefficients[i, 2] = next(
+            height for roof, height in zip(roof_segments, heights) if roof.contains(point)
+        )
+    vertices = []
+    building = create_roof_building(vertices, footprint, segments, (origins, coefficients), bottom_z)
+    return building, vertices
+
+
+def directed_edges(building):
+    edges = Counter()
+    for surface in building.geometry:
+        for ring in surface:
+            edges.update(zip(ring, ring[1:] + ring[:1]))
+    return edges
+
+
+def assert_watertight(building):
+    # every edge is used once in each direction, without T-junctions
+    edges = directed_edges(building)
+    unmatched = [edge for edge, count in edges.items() if count != 1 or edges[edge[::-1]] != 1]
+    assert unmatched == []
+
+
+@pytest.mark.parametrize(
+    "footprint",
+    [
+        box(0, 0, 10, 10),
+        Polygon([(0, 0), (10, 0), (10, 10), (0, 10)], [[(6, 6), (8, 6), (8, 8), (6, 8)]]),
+    ],
+)
+def test_stepped_roof_is_watertight(footprint):
+    roofs = [box(-1, -1, 5, 11), box(5, -1, 11, 4), box(5, 4, 11, 11)]
+    building, _ = build(footprint, roofs, [10.0, 6.0, 8.0])
+
+    assert_watertight(building)
+    # ground, three roofs, and a wall for every footprint edge piece and step
+    assert building.semantic.count(1) == 1
+    assert building.semantic.count(0) == 3
+
+
+def test_split_points_are_in_the_ground_ring():
+    building, vertices = build(box(0, 0, 10, 10), [box(-1, -1, 5, 11), box(5, -1, 11, 11)], [10.0, 6.0])
+
+    ground = building.geometry[building.semantic.index(1)][0]
+    assert sorted(tuple(vertices[i][:2]) for i in ground) == [
+        (0.0, 0.0), (0.0, 10.0), (5.0, 0.0), (5.0, 10.0), (10.0, 0.0), (10.0, 10.0)
+    ]
+    assert_watertight(building)
+
+
+def test_crossing_roof_planes_are_watertight():
+    footprint = box(0, 0, 10, 10)
+    segments = split_roof_segments(footprint, [box(-1, -1, 5, 11), box(5, -1, 11, 11)])
+    origins = np.array([segment.centroid.coords[0] for segment in segments])
+    # gables meeting at x = 5, where the planes cross at y = 5
+    coefficients = np.array([[1.0, 0.01, 7.5], [-1.0, -0.01, 7.5]])
+    if origins[0, 0] > origins[1, 0]:
+        coefficients = coefficients[::-1]
+    vertices = []
+    building = create_roof_building(vertices, footprint, segments, (origins, coefficients), 0.0)
+
+    assert_watertight(building)
+    # both roofs share the ridge point, and each closes the part it is higher on
+    ridge = [i for i, (x, y, z) in enumerate(vertices) if (x, y) == pytest.approx((5.0, 5.0))]
+    assert len(ridge) == 1 and vertices[ridge[0]][2] == pytest.approx(10.0)
+    inner_walls = [
+        surface[0] for surface, semantic in zip(building.geometry, building.semantic)
+        if semantic == 2 and all(vertices[i][0] == pytest.approx(5.0) for i in surface[0])
+    ]
+    assert sorted(len(ring) for ring in inner_walls) == [3, 3]
@@ -0,0 +1,78 @@
+import pickle
+
+import laspy
+import numpy as np
+import pytest
+
+pytest.importorskip("PyQt5")
+ensemble = pytest.importorskip("sklearn.ensemble")
+
+from ai.point_cloud_classification.interface import PointCloudClassificationParams
+from ai.point_cloud_classification.runner import PointCloudClassification
+from enums.point_cloud_classification import AlgorithmOptions, FeatureOptions
+from utils.io_las import CLASS_LUT
+
+
+@pytest.fixture(scope="module")
+def point_cloud(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("point_cloud")
+    rng = np.random.default_rng(0)
+    count = 30_001
+    header = laspy.LasHeader(point_format=3, version="1.2")
+    header.scales = [0.01, 0.01, 0.01]
+    header.offsets = [430000.0, 9140000.0, 0.0]
+    las = laspy.LasData(header)
+    las.x = 430000.0 + rng.random(count) * 100
+    las.y = 9140000.0 + rng.random(count) * 100
+    las.z = rng.random(count) * 30
+    las.red, las.green, las.blue = rng.integers(0, 65535, (3, count))
+    las.gps_time = rng.random(count) * 1e5
+    las.return_number = rng.integers(1, 4, count)
+    path = str(directory / "cloud.las")
+    las.write(path)
+
+    features = np.column_stack((las.x, las.y, las.z, las.red, las.green, las.blue))
+    labels = np.digitize(las.z, [10, 20])
+    model = ensemble.RandomForestClassifier(n_estimators=8, max_depth=6, random_state=0)
+    model.fit(features[::10], labels[::10])
+    model_path = str(directory / "model.pkl")
+    with open(model_path, "wb") as model_file:
+        pickle.dump(model, model_file)
+    return directory, path, model_path
+
+
+def classify(point_cloud, name, **params):
+    directory, path, model_path = point_cloud
+    output_path = str(directory / name)
+    runner = PointCloudClassification(PointCloudClassificationParams(
+        algorithm=AlgorithmOptions.RF.value,
+        features=FeatureOptions.RGB.value,
+        model=model_path,
+        point_cloud_path=path,
+        output_path=output_path,
+        **params,
+    ))
+    runner.run()
+    return laspy.read(f"{output_path}.las")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunked_prediction_matches_whole_cloud(point_cloud, workers):
+    whole = classify(point_cloud, "whole", chunk_size=None, copy_source=False)
+    chunked = classify(point_cloud, f"chunked_{workers}", chunk_size=7777, workers=workers, copy_source=False)
+
+    assert set(np.unique(whole.classification)) <= set(CLASS_LUT.tolist())
+    for dimension in ("X", "Y", "Z", "red", "green", "blue", "classification"):
+        np.testing.assert_array_equal(chunked[dimension], whole[dimension])
+
+
+def test_copy_source_keeps_the_other_dimensions(point_cloud):
+    source = laspy.read(point_cloud[1])
+    whole = classify(point_cloud, "whole", chunk_size=None, copy_source=False)
+    copy = classify(point_cloud, "copy", chunk_size=7777)
+
+    assert copy.header.point_format.id == source.header.point_format.id
+    np.testing.assert_array_equal(copy.classification, whole.classification)
+    for dimension in source.point_format.dimension_names:
+        if dimension != "classification":
+            np.testing.assert_array_equal(copy[dimension], source[dimension])
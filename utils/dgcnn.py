@@ -1,13 +1,633 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
 import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from utils.model_registry import MODEL_REGISTRY
+
+def add_vote(vote_label_pool, point_idx, pred_label, weight, scores=None):
+    """
+    Add the predictions of a batch to the votes of every point.
+
+    Args:
+    - vote_label_pool: (num_points, num_classes) votes, updated in place
+    - point_idx: (B, N) point of every prediction
+    - pred_label: (B, N) predicted class, one vote each
+    - weight: (B, N) sample weight, predictions weighted 0 or inf are left out
+    - scores: (B, N, num_classes) class probabilities to add instead of one
+      vote for pred_label (default: hard votes)
+
+    Returns:
+    - vote_label_pool
+    """
+    num_classes = vote_label_pool.shape[1]
+    weight = np.asarray(weight)
+    valid = (weight != 0) & ~np.isinf(weight)
+    point_idx = np.asarray(point_idx)[valid].astype(np.int64)
+
+    if scores is not None:
+        np.add.at(vote_label_pool, point_idx, np.asarray(scores)[valid][:, :num_classes])
+        return vote_label_pool
+
+    pred_label = np.asarray(pred_label)[valid].astype(np.int64)
+    in_range = pred_label < num_classes
+    for label in np.unique(pred_label[~in_range]):
+        print(f"Warning: Predicted label {label} is out of bounds for the current class range.")
+    np.add.at(vote_label_pool, (point_idx[in_range], pred_label[in_range]), 1)
+    return vote_label_pool
+
+
+@dataclass
+class BlockPartition:
+    """
+    Points grouped by the XY block they fall in, CSR style.
+
+    Attributes:
+    - points: the points sorted by block, input order kept within a block
+    - order: index of every sorted point in the input array
+    - offsets: block k holds points[offsets[k]:offsets[k + 1]]
+    - num_blocks_x, num_blocks_y: number of blocks in each dimension,
+      block k is (k // num_blocks_y, k % num_blocks_y) as in split_array
+    """
+
+    points: np.ndarray
+    order: np.ndarray
+    offsets: np.ndarray
+    num_blocks_x: int
+    num_blocks_y: int
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key: int) -> np.ndarray:
+        return self.points[self.offsets[key] : self.offsets[key + 1]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for key in range(len(self)):
+            yield self[key]
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def gather(self, keys: List[int]) -> np.ndarray:
+        """Points of several blocks, a view when there is only one"""
+        if len(keys) == 1:
+            return self[keys[0]]
+        return np.concatenate([self[key] for key in keys])
+
+    def spill(self, path: str) -> None:
+        """Move the sorted points to a memory-mapped .npy file, blocks then
+        read from disk on demand instead of staying in memory"""
+        points = np.lib.format.open_memmap(
+            path, mode="w+", dtype=self.points.dtype, shape=self.points.shape
+        )
+        points[:] = self.points
+        points.flush()
+        self.points = np.load(path, mmap_mode="r")
+
+
+def _block_index(coords: np.ndarray, min_extent: float, block_size: float, num_blocks: int = None) -> np.ndarray:
+    index = np.floor((coords - min_extent) / block_size).astype(np.int64)
+    # match the `start <= x < start + block_size` bounds of split_array, with
+    # start computed as there, where the division rounds across a block edge
+    index -= coords < min_extent + index * block_size
+    index += coords >= (min_extent + index * block_size) + block_size
+    if num_blocks is not None:
+        # the blocks cover the extent, a point on its edge stays in the last one
+        np.minimum(index, num_blocks - 1, out=index)
+    return index
+
+
+def partition_blocks(
+    data: np.ndarray, block_size: float, num_blocks_x: int = None, num_blocks_y: int = None
+) -> BlockPartition:
+    """
+    Split points into square XY blocks in one pass: the block of every point is
+    computed once and the points are sorted by it, blocks are then views.
+
+    Args:
+    - data: numpy array containing point cloud data, x and y in the first columns
+    - block_size: size of each block in meters
+    - num_blocks_x, num_blocks_y: number of blocks in each dimension, points
+      beyond them are left out (default: enough blocks to cover the extent,
+      every point is then in a block)
+
+    Returns:
+    - BlockPartition with every block, empty ones included
+    """
+    min_extent_x, min_extent_y = np.min(data[:, 0]), np.min(data[:, 1])
+    # blocks fitted to the extent hold every point, explicit counts may leave some out
+    fit_x, fit_y = num_blocks_x is None, num_blocks_y is None
+    if fit_x:
+        num_blocks_x = int((np.max(data[:, 0]) - min_extent_x) / block_size) + 1
+    if fit_y:
+        num_blocks_y = int((np.max(data[:, 1]) - min_extent_y) / block_size) + 1
+
+    index_x = _block_index(data[:, 0], min_extent_x, block_size, num_blocks_x if fit_x else None)
+    index_y = _block_index(data[:, 1], min_extent_y, block_size, num_blocks_y if fit_y else None)
+    keys = index_x * num_blocks_y + index_y
+    # points outside of the blocks get the key past the last block
+    num_blocks = num_blocks_x * num_blocks_y
+    keys[(index_x >= num_blocks_x) | (index_y >= num_blocks_y)] = num_blocks
+
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(num_blocks + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_blocks + 1)[:num_blocks], out=offsets[1:])
+    order = order[: offsets[-1]]
+
+    return BlockPartition(data[order], order, offsets, num_blocks_x, num_blocks_y)
+
+
+def group_blocks(partition: BlockPartition, min_points: int) -> Dict[int, List[int]]:
+    """
+    Merge every block with fewer than min_points points into the nearest
+    block (by block distance) that has enough, instead of dropping it.
+
+    Args:
+    - partition: blocks from partition_blocks
+    - min_points: smallest number of points of a block on its own
+
+    Returns:
+    - Kept block number -> block numbers whose points it classifies, in order
+    """
+    counts = partition.counts()
+    non_empty = np.flatnonzero(counts)
+    kept = non_empty[counts[non_empty] >= min_points]
+    small = non_empty[counts[non_empty] < min_points]
+    if not kept.size:
+        # only small blocks, classify them together
+        return {int(non_empty[0]): non_empty.tolist()} if non_empty.size else {}
+
+    groups = {int(key): [int(key)] for key in kept}
+    if small.size:
+        kept_x, kept_y = np.divmod(kept, partition.num_blocks_y)
+        small_x, small_y = np.divmod(small, partition.num_blocks_y)
+        distance = (small_x[:, None] - kept_x) ** 2 + (small_y[:, None] - kept_y) ** 2
+        for key, target in zip(small.tolist(), kept[np.argmin(distance, axis=1)].tolist()):
+            groups[target].append(key)
+    return groups
+
+
+def window_members(
+    points: np.ndarray, block_size: float, stride: float, padding: float
+) -> Iterator[Tuple[float, float, np.ndarray]]:
+    """
+    Sliding windows over the XY extent of points, with the indices of the
+    points inside every window. Points are indexed once on a grid of stride
+    sized cells, so a window only tests the points of the cells it overlaps.
+
+    Args:
+    - points: numpy array with x and y in the first columns
+    - block_size: window size in meters
+    - stride: distance between windows in meters
+    - padding: margin added around every window
+
+    Yields:
+    - Window start x, start y and the sorted indices of its points, in the
+      order of ScannetDatasetWholeScene (x fastest), empty windows included
+    """
+    coord_min, coord_max = np.amin(points[:, :2], axis=0), np.amax(points[:, :2], axis=0)
+    grid_x = int(np.ceil(float(coord_max[0] - coord_min[0] - block_size) / stride) + 1)
+    grid_y = int(np.ceil(float(coord_max[1] - coord_min[1] - block_size) / stride) + 1)
+
+    cells_x = int((coord_max[0] - coord_min[0]) / stride) + 1
+    cells_y = int((coord_max[1] - coord_min[1]) / stride) + 1
+
+    def cell(values, start, count):
+        return np.clip(np.floor((values - start) / stride), 0, count - 1).astype(np.int64)
+
+    keys = cell(points[:, 1], coord_min[1], cells_y) * cells_x + cell(points[:, 0], coord_min[0], cells_x)
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(cells_x * cells_y + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=cells_x * cells_y), out=offsets[1:])
+
+    for index_y in range(grid_y):
+        for index_x in range(grid_x):
+            e_x = min(coord_min[0] + index_x * stride + block_size, coord_max[0])
+            s_x = e_x - block_size
+            e_y = min(coord_min[1] + index_y * stride + block_size, coord_max[1])
+            s_y = e_y - block_size
+
+            first_x, last_x = cell(np.array([s_x - padding, e_x + padding]), coord_min[0], cells_x)
+            first_y, last_y = cell(np.array([s_y - padding, e_y + padding]), coord_min[1], cells_y)
+            # cells of a row are contiguous in the sorted order
+            candidates = np.concatenate(
+                [
+                    order[offsets[row * cells_x + first_x] : offsets[row * cells_x + last_x + 1]]
+                    for row in range(first_y, last_y + 1)
+                ]
+            )
+            x, y = points[candidates, 0], points[candidates, 1]
+            inside = (
+                (x >= s_x - padding) & (x <= e_x + padding) & (y >= s_y - padding) & (y <= e_y + padding)
+            )
+            yield s_x, s_y, np.sort(candidates[inside])
+
+
+def _fill_window(
+    points: np.ndarray,
+    members: np.ndarray,
+    s_x: float,
+    s_y: float,
+    block_size: float,
+    coord_max: np.ndarray,
+    normalize: Callable[[np.ndarray], None],
+    rng,
+    data_batch: np.ndarray,
+    point_idxs: np.ndarray,
+) -> None:
+    """Fill the rows of one window, its members padded with randomly repeated
+    ones to the size of point_idxs and shuffled"""
+    channels = points.shape[1]
+    size = point_idxs.size
+    replace = size - members.size > members.size
+    point_idxs[: members.size] = members
+    point_idxs[members.size :] = rng.choice(members, size - members.size, replace=replace)
+    rng.shuffle(point_idxs)
+
+    data_batch[:, :channels] = points[point_idxs]
+    data_batch[:, channels:] = data_batch[:, :3] / coord_max
+    data_batch[:, 0] -= s_x + block_size / 2.0
+    data_batch[:, 1] -= s_y + block_size / 2.0
+    normalize(data_batch[:, :channels])
+
+
+def whole_scene_windows(
+    points: np.ndarray,
+    labels: np.ndarray,
+    labelweights: np.ndarray,
+    block_points: int,
+    block_size: float,
+    stride: float,
+    padding: float,
+    normalize: Callable[[np.ndarray], None],
+    rng=None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Batches of block_points points of every sliding window of a scene. Windows
+    are padded with randomly repeated points to whole batches and shuffled;
+    the output size is known before filling, so every array is allocated once.
+
+    Args:
+    - points: scene points, x y z then the features
+    - labels: label of every point
+    - labelweights: sample weight of every label
+    - block_points: points per batch
+    - block_size, stride, padding: sliding window, see window_members
+    - normalize: normalizes the features of a window in place
+    - rng: numpy Generator or RandomState (default: fresh unseeded Generator)
+
+    Returns:
+    - Points with their window centred XY and the XYZ normalized by the scene
+      maximum appended, labels, sample weights and point indices, each
+      shaped (batches, block_points, ...)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    coord_max = np.amax(points[:, :3], axis=0)
+
+    windows = [window for window in window_members(points, block_size, stride, padding) if window[2].size]
+    sizes = [int(np.ceil(members.size / block_points)) * block_points for _, _, members in windows]
+    total = sum(sizes)
+    channels = points.shape[1]
+
+    data_room = np.empty((total, channels + 3), dtype=np.result_type(points.dtype, np.float64))
+    index_room = np.empty(total, dtype=np.int64)
+    start = 0
+    for (s_x, s_y, members), size in zip(windows, sizes):
+        stop = start + size
+        _fill_window(
+            points, members, s_x, s_y, block_size, coord_max, normalize, rng,
+            data_room[start:stop], index_room[start:stop],
+        )
+        start = stop
+
+    label_room = labels[index_room].astype(int)
+    sample_weight = labelweights[label_room]
+    return (
+        data_room.reshape((-1, block_points, channels + 3)),
+        label_room.reshape((-1, block_points)),
+        sample_weight.reshape((-1, block_points)),
+        index_room.reshape((-1, block_points)),
+    )
+
+
+def iter_scene_windows(
+    points: np.ndarray,
+    labels: np.ndarray,
+    labelweights: np.ndarray,
+    block_points: int,
+    block_size: float,
+    stride: float,
+    padding: float,
+    normalize: Callable[[np.ndarray], None],
+    rng=None,
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Same batches as whole_scene_windows, built one window at a time, so the
+    first ones can be classified before the last windows of the scene exist.
+
+    Yields:
+    - Points, labels, sample weights and point indices of every non empty
+      window, each shaped (window batches, block_points, ...); concatenated
+      they equal the arrays of whole_scene_windows with the same rng
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    coord_max = np.amax(points[:, :3], axis=0)
+    channels = points.shape[1]
+    dtype = np.result_type(points.dtype, np.float64)
+
+    for s_x, s_y, members in window_members(points, block_size, stride, padding):
+        if not members.size:
+            continue
+        size = int(np.ceil(members.size / block_points)) * block_points
+        data_batch = np.empty((size, channels + 3), dtype=dtype)
+        point_idxs = np.empty(size, dtype=np.int64)
+        _fill_window(points, members, s_x, s_y, block_size, coord_max, normalize, rng, data_batch, point_idxs)
+
+        label_batch = labels[point_idxs].astype(int)
+        yield (
+            data_batch.reshape((-1, block_points, channels + 3)),
+            label_batch.reshape((-1, block_points)),
+            labelweights[label_batch].reshape((-1, block_points)),
+            point_idxs.reshape((-1, block_points)),
+        )
+
+
+def resolve_device(device: str) -> str:
+    """The torch device to run on, "auto" is CUDA when available and CPU otherwise"""
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def model_variant(name: str, args) -> str:
+    """Session name of a classifier built from ``args``, every argument that
+    changes the model or the shape of its weights is part of it"""
+    return (
+        f"{name}-classes{args.num_classes}-emb{args.emb_dims}"
+        f"-k{args.k}-chunk{args.knn_chunk_size}-reuse{args.reuse_knn}"
+    )
+
+
+class PointwiseLinear(nn.Module):
+    """
+    A 1x1 convolution as a linear layer over the channel dimension, which
+    dynamic quantization supports.
+
+    Args:
+    - conv: 1x1 Conv1d or Conv2d with stride 1, no padding and no groups
+    """
+
+    def __init__(self, conv: nn.Module):
+        super().__init__()
+        self.linear = nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+        self.linear.weight.data.copy_(conv.weight.data.flatten(1))
+        if conv.bias is not None:
+            self.linear.bias.data.copy_(conv.bias.data)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.linear(x.movedim(1, -1)).movedim(-1, 1)
+
+
+def _is_pointwise(module: nn.Module) -> bool:
+    return (
+        isinstance(module, (nn.Conv1d, nn.Conv2d))
+        and all(size == 1 for size in module.kernel_size)
+        and all(step == 1 for step in module.stride)
+        and all(pad == 0 for pad in module.padding)
+        and module.groups == 1
+    )
+
+
+def fuse_conv_bn(model: nn.Module) -> nn.Module:
+    """Fold every batch norm that directly follows a convolution into it, in place"""
+    for sequential in [module for module in model.modules() if isinstance(module, nn.Sequential)]:
+        for i in range(len(sequential) - 1):
+            conv, norm = sequential[i], sequential[i + 1]
+            if isinstance(conv, (nn.Conv1d, nn.Conv2d)) and isinstance(
+                norm, (nn.BatchNorm1d, nn.BatchNorm2d)
+            ):
+                sequential[i] = fuse_conv_bn_eval(conv, norm)
+                sequential[i + 1] = nn.Identity()
+    return model
+
+
+def optimize_for_cpu(model: nn.Module, quantize: bool = False) -> nn.Module:
+    """
+    Inference copy of an evaluated model for CPU: conv-bn fused, and with the
+    pointwise convolutions as dynamically quantized int8 linear layers when
+    quantizing.
+
+    Args:
+    - model: classifier in eval mode
+    - quantize: quantize the pointwise convolutions to int8
+
+    Returns:
+    - the optimized model
+    """
+    model = fuse_conv_bn(model.eval())
+    if not quantize:
+        return model
+
+    for parent in list(model.modules()):
+        for name, child in parent.named_children():
+            if _is_pointwise(child):
+                setattr(parent, name, PointwiseLinear(child))
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+class StageTimes:
+    """Wall time spent in every stage of a run, summed over its blocks"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f} s" for name, seconds in self.seconds.items())
+
+
+# marks the end of the batches of a producer
+_DONE = object()
+
+
+def prefetch_batches(
+    prepare: Callable[[], Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]],
+    batch_size: int,
+    pin_memory: bool = False,
+    depth: int = 2,
+    times: Optional[StageTimes] = None,
+) -> Iterator[Tuple[torch.Tensor, np.ndarray, np.ndarray]]:
+    """
+    Batches of a scene prepared on a background thread, so the windows and
+    tensors of the next batches are built while the current one runs.
+
+    Args:
+    - prepare: returns the windows of the scene one at a time, as
+      iter_scene_windows; windows are only built as batches are needed
+    - batch_size: windows per batch, the last batch may be smaller
+    - pin_memory: put the tensors in page-locked memory for faster copies to the GPU
+    - depth: batches prepared ahead, bounds the memory of the queue
+    - times: records the "windows", "prepare" and "wait" stages
+
+    Yields:
+    - (batch, channels, points) float32 tensor, point indices and sample weights of every batch
+    """
+    times = StageTimes() if times is None else times
+    batches: "queue.Queue" = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item) -> None:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce() -> None:
+        try:
+            windows = iter(prepare())
+            # rows of the windows not yet put in a batch
+            pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+            rows = 0
+            while not stop.is_set():
+                with times.stage("windows"):
+                    window = next(windows, None)
+                if window is not None:
+                    data, _, smpw, point_index = window
+                    pending.append((data, point_index, smpw))
+                    rows += data.shape[0]
+                while rows >= batch_size or (window is None and rows):
+                    with times.stage("prepare"):
+                        data, point_index, smpw = (
+                            np.concatenate(parts) if len(pending) > 1 else parts[0] for parts in zip(*pending)
+                        )
+                        batch = torch.from_numpy(
+                            np.ascontiguousarray(data[:batch_size].transpose(0, 2, 1), dtype=np.float32)
+                        )
+                        if pin_memory:
+                            batch = batch.pin_memory()
+                        pending = [(data[batch_size:], point_index[batch_size:], smpw[batch_size:])]
+                        rows = max(rows - batch_size, 0)
+                    put((batch, point_index[:batch_size], smpw[:batch_size]))
+                if window is None:
+                    break
+        except BaseException as error:
+            # raised again on the consumer side
+            put(error)
+        else:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="dgcnn-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            with times.stage("wait"):
+                item = batches.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+class DGCNNSession:
+    """
+    A DGCNN classifier built and loaded once, then reused for every block.
+
+    Args:
+    - model: the classifier, before its weights are loaded
+    - checkpoint: state dict saved from nn.DataParallel
+    - device: torch device to run on, "auto" for CUDA when available
+    - quantize: on CPU, run the pointwise convolutions with dynamic int8 weights
+    """
+
+    def __init__(
+        self, model: nn.Module, checkpoint: str, device: str = "cuda", quantize: bool = False
+    ):
+        self.device = torch.device(resolve_device(device))
+        classifier = nn.DataParallel(model.to(self.device))
+        classifier.load_state_dict(
+            torch.load(checkpoint, weights_only=False, map_location=self.device)
+        )
+        classifier = classifier.eval()
+        if self.device.type == "cpu":
+            # DataParallel only forwards to the module without GPUs
+            classifier = optimize_for_cpu(classifier.module, quantize)
+        self.classifier = classifier
+        self.warm = False
+        self.in_use = False
+
+    @classmethod
+    def open(
+        cls,
+        name: str,
+        model_factory: Callable[[], nn.Module],
+        checkpoint: str,
+        device: str = "cuda",
+        keep_warm: bool = False,
+        quantize: bool = False,
+    ) -> "DGCNNSession":
+        """
+        Session for a checkpoint, the one of an earlier run is reused when it
+        was kept warm in the model registry and the checkpoint file did not
+        change since.
+
+        Args:
+        - name: model variant, sessions of different variants are not shared
+        - model_factory: builds the classifier when no warm session exists
+        - checkpoint: state dict saved from nn.DataParallel
+        - device: torch device to run on, "auto" for CUDA when available
+        - keep_warm: keep the session loaded after release() for the next run
+        - quantize: on CPU, run the pointwise convolutions with dynamic int8 weights
+        """
+        device = resolve_device(device)
+        kind = f"dgcnn/{name}/{device}/quantize={quantize}"
+        session = MODEL_REGISTRY.peek(checkpoint, kind)
+        if session is None and keep_warm:
+            load = lambda path: cls(model_factory(), path, device, quantize)
+            session = MODEL_REGISTRY.get(checkpoint, load, kind, on_evict=DGCNNSession._evicted)
+            session.warm = True
+        elif session is None:
+            session = cls(model_factory(), os.path.abspath(checkpoint), device, quantize)
+        session.in_use = True
+        return session
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.classifier(batch.to(self.device, non_blocking=True))
+
+    def release(self) -> None:
+        """End of a run, frees the model unless it is kept warm"""
+        self.in_use = False
+        if not self.warm:
+            self.close()
+
+    def _evicted(self) -> None:
+        # dropped from the model registry, a running session is freed at its release
+        self.warm = False
+        if not self.in_use:
+            self.close()
 
-def add_vote(vote_label_pool, point_idx, pred_label, weight):
-    B = pred_label.shape[0]
-    N = pred_label.shape[1]
-    for b in range(B):
-        for n in range(N):
-            if weight[b, n] != 0 and not np.isinf(weight[b, n]):
-                if int(pred_label[b, n]) < vote_label_pool.shape[1]:
-                    vote_label_pool[int(point_idx[b, n]), int(pred_label[b, n])] += 1
-                else:
-                    print(f"Warning: Predicted label {int(pred_label[b, n])} is out of bounds for the current class range.")
-    return vote_label_pool
\ No newline at end of file
+    def close(self) -> None:
+        self.classifier = None
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
@@ -1,44 +1,204 @@
 import laspy
 import numpy as np
 
+# Points read from the file at a time
+LAS_CHUNK_SIZE = 1_000_000
+RGB_DIMENSIONS = ("x", "y", "z", "red", "green", "blue")
+INTENSITY_DIMENSIONS = ("x", "y", "z", "intensity")
+
+def iter_las_chunks(filepath, dimensions=RGB_DIMENSIONS, chunk_size: int = LAS_CHUNK_SIZE, dtype=np.float64, xy_offset=None):
+    """Stream the points of a LAS/LAZ file, chunk_size points at a time.
+
+    Args:
+        filepath: LAS or LAZ file.
+        dimensions: point dimensions to read, in column order (x, y and z scaled).
+        chunk_size: points per chunk.
+        dtype: dtype of the chunks, None for structured chunks with the
+            native dtype of every dimension.
+        xy_offset: subtracted from x and y before the cast to ``dtype``, so
+            float32 keeps the precision of projected coordinates.
+
+    Yields:
+        (n, len(dimensions)) arrays, or structured (n,) arrays when dtype is None.
+    """
+    x_offset, y_offset = (0.0, 0.0) if xy_offset is None else xy_offset
+    with laspy.open(filepath) as reader:
+        for points in reader.chunk_iterator(chunk_size):
+            columns = []
+            for dimension in dimensions:
+                values = np.asarray(points[dimension])
+                if dimension == "x" and xy_offset is not None:
+                    values = values - x_offset
+                elif dimension == "y" and xy_offset is not None:
+                    values = values - y_offset
+                columns.append(values)
+
+            if dtype is None:
+                chunk = np.empty(len(points), dtype=[(dimension, values.dtype) for dimension, values in zip(dimensions, columns)])
+                for dimension, values in zip(dimensions, columns):
+                    chunk[dimension] = values
+            else:
+                chunk = np.empty((len(points), len(dimensions)), dtype=dtype)
+                for i, values in enumerate(columns):
+                    chunk[:, i] = values
+            yield chunk
+
+def read_las_array(filepath, dimensions=RGB_DIMENSIONS, dtype=np.float64, xy_offset=None, out=None, chunk_size: int = LAS_CHUNK_SIZE):
+    """Read the dimensions of every point into one array, filled chunk by chunk
+    so no full size temporary is made.
+
+    Args:
+        out: array to fill instead of a new one (e.g. a memory map), with at
+            least len(dimensions) columns, the others are left untouched.
+
+    See iter_las_chunks for the other arguments.
+    """
+    if out is None:
+        out = np.empty((read_las_header(filepath).point_count, len(dimensions)), dtype=dtype)
+    start = 0
+    for chunk in iter_las_chunks(filepath, dimensions, chunk_size, out.dtype, xy_offset):
+        out[start:start + len(chunk), :len(dimensions)] = chunk
+        start += len(chunk)
+    return out
+
+def read_las_header(filepath):
+    """Header of a LAS/LAZ file (point count, bounds), without reading the points"""
+    with laspy.open(filepath) as reader:
+        return reader.header
+
 def read_las(filepath, isIntensity = False):
-    inFile = laspy.read(filepath)
-    x = inFile.x
-    y = inFile.y
-    z = inFile.z
+    return read_las_array(filepath, INTENSITY_DIMENSIONS if isIntensity else RGB_DIMENSIONS)
+
+# Class: 2 = ground, 5 = vegetation, 6 = building
+CLASS_LUT = np.array([2, 5, 6], dtype=np.uint8)
+
+def remap_classes(labels, lut=CLASS_LUT):
+    """Map predicted labels to LAS classification codes with a lookup table"""
+    return np.take(lut, np.asarray(labels).astype(np.intp))
+
+def output_header(source_header, point_format=None):
+    """Empty header with the point format, version, scales, offsets and VLRs
+    (e.g. the CRS) of ``source_header``, or with ``point_format`` instead of
+    the source one (the version is raised to 1.2 at least)"""
+    if point_format is None:
+        header = laspy.LasHeader(point_format=source_header.point_format, version=source_header.version)
+    else:
+        header = laspy.LasHeader(point_format=point_format, version=max(str(source_header.version), "1.2"))
+    header.scales = source_header.scales
+    header.offsets = source_header.offsets
+    header.vlrs.extend(source_header.vlrs)
+    return header
+
+def _fill_points(points, data, isIntensity: bool = False, labels=None, xy_offset=None):
+    x_offset, y_offset = (0.0, 0.0) if xy_offset is None else xy_offset
+    # float64 before the offset, float32 points would lose UTM precision
+    points.x = data[:, 0].astype(np.float64) + x_offset
+    points.y = data[:, 1].astype(np.float64) + y_offset
+    points.z = data[:, 2]
 
     if isIntensity:
-        I = inFile.intensity
-        data = np.column_stack((x, y, z, I))
+        points.intensity = data[:, 3]
+        label_column = 4
     else:
-        r = inFile.red
-        g = inFile.green
-        b = inFile.blue
-        data = np.column_stack((x, y, z, r, g, b))
-    
-    return data
-
-def save_las(data, output_path: str, isIntensity: bool = False):
+        points.red = data[:, 3]
+        points.green = data[:, 4]
+        points.blue = data[:, 5]
+        label_column = 6
+
+    points.classification = remap_classes(data[:, label_column] if labels is None else labels)
+
+def save_las(data, output_path: str, isIntensity: bool = False, labels=None, xy_offset=None):
+    """Write points as LAS (RGB) or LAZ (intensity).
+
+    Args:
+        data: (N, C) points, x y z then r g b or intensity, with the predicted
+            label as last column unless ``labels`` is given.
+        output_path: output path without extension.
+        isIntensity: whether ``data`` holds intensity instead of RGB.
+        labels: (N,) predicted labels, written without stacking them to ``data``.
+        xy_offset: offset added to x and y, e.g. to restore UTM coordinates.
+    """
     ext = "laz" if isIntensity else "las"
 
     header = laspy.LasHeader(point_format=2, version="1.2")
     las = laspy.LasData(header)
-    las.x = data[:, 0]
-    las.y = data[:, 1]
-    las.z = data[:, 2]
+    _fill_points(las, data, isIntensity, labels, xy_offset)
 
-    # Class: 2 = ground, 5 = vegetation, 6 = building
-    reverse_mapping = {0: 2, 1: 5, 2: 6}
-    if isIntensity:
-        las.intensity = data[:, 3]
-        classification_data = np.array([reverse_mapping[label] for label in data[:, 4]])
-    else:
-        las.red = data[:, 3]
-        las.green = data[:, 4]
-        las.blue = data[:, 5]
-        classification_data = np.array([reverse_mapping[label] for label in data[:, 6]])
-    
-    classification_data = classification_data.astype(np.uint8)
-    las.classification = classification_data
-
-    las.write(f"{output_path}.{ext}")
\ No newline at end of file
+    las.write(f"{output_path}.{ext}")
+
+class LasResultWriter:
+    """One LAS (RGB) or LAZ (intensity) output that classified blocks are
+    streamed into, the header bounds and point count are updated on close.
+
+    Args:
+        output_path: output path without extension.
+        isIntensity: whether the blocks hold intensity instead of RGB.
+        header: header of the input to take the scales, offsets and CRS
+            from. The points are always written in point format 2, which
+            holds only the dimensions filled here; LasCopyWriter keeps the
+            other dimensions of the input.
+    """
+
+    def __init__(self, output_path: str, isIntensity: bool = False, header=None):
+        self.isIntensity = isIntensity
+        self.path = f"{output_path}.{'laz' if isIntensity else 'las'}"
+        if header is None:
+            header = laspy.LasHeader(point_format=2, version="1.2")
+        else:
+            header = output_header(header, point_format=2)
+        self.writer = laspy.open(self.path, mode="w", header=header, do_compress=isIntensity)
+
+    def write(self, data, labels=None, xy_offset=None):
+        """Append a block, with the arguments of save_las"""
+        points = laspy.ScaleAwarePointRecord.zeros(len(data), header=self.writer.header)
+        _fill_points(points, data, self.isIntensity, labels, xy_offset)
+        self.writer.write_points(points)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class LasCopyWriter:
+    """Copy of a LAS/LAZ file with only its classification rewritten: the
+    header, point format and every other dimension (GPS time, returns, ...)
+    are kept. Source points are streamed in step with the labels.
+
+    Args:
+        source_path: LAS or LAZ file to copy.
+        output_path: output path without extension.
+        isIntensity: write LAZ instead of LAS, as LasResultWriter.
+        lut: lookup table from predicted label to classification code.
+    """
+
+    def __init__(self, source_path: str, output_path: str, isIntensity: bool = False, lut=CLASS_LUT):
+        self.lut = lut
+        self.path = f"{output_path}.{'laz' if isIntensity else 'las'}"
+        self.reader = laspy.open(source_path)
+        self.writer = laspy.open(self.path, mode="w", header=output_header(self.reader.header), do_compress=isIntensity)
+
+    def write(self, labels):
+        """Copy the next len(labels) source points with these labels"""
+        points = self.reader.read_points(len(labels))
+        if len(points) != len(labels):
+            raise ValueError("More labels than points in the source point cloud")
+        points.classification = remap_classes(labels, self.lut)
+        self.writer.write_points(points)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,111 @@
+"""
+Process wide registry of loaded models.
+A model is keyed by its kind, file path and modification time, so it is read
+once and reused by every run of any tab until its file changes. The least
+recently used models are evicted when the loaded ones exceed a memory budget.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+# memory budget of the loaded models, in MB
+MODEL_MEMORY_BUDGET = 8192
+# XGBoost native model formats, loaded without unpickling
+XGBOOST_EXTENSIONS = (".json", ".ubj", ".bin", ".model")
+
+
+class ModelRegistry:
+    """Loaded models in least recently used order
+
+    Keyword Arguments:
+        max_memory {float} -- budget in MB, estimated from the model file sizes (default: {MODEL_MEMORY_BUDGET})
+    """
+
+    def __init__(self, max_memory: float = MODEL_MEMORY_BUDGET):
+        self.max_bytes = int(max_memory * 1024 * 1024)
+        self._models: "OrderedDict[Tuple[str, str, float], Tuple[Any, int, Optional[Callable[[Any], None]]]]"
+        self._models = OrderedDict()
+        self._bytes = 0
+        # runs of different tabs load from their own threads
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(path: str, kind: str) -> Tuple[str, str, float]:
+        path = os.path.abspath(path)
+        return kind, path, os.path.getmtime(path)
+
+    def peek(self, path: str, kind: str = "") -> Any:
+        """The loaded model of ``path``, None when it is not loaded or its file changed"""
+        key = self._key(path, kind)
+        with self._lock:
+            if key not in self._models:
+                return None
+            self._models.move_to_end(key)
+            return self._models[key][0]
+
+    def get(
+        self,
+        path: str,
+        loader: Callable[[str], Any],
+        kind: str = "",
+        on_evict: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        """Model of ``path``, loaded with ``loader`` unless already loaded.
+        ``kind`` separates models built differently from the same file, and
+        ``on_evict`` frees a model (e.g. GPU memory) when it is evicted."""
+        key = self._key(path, kind)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+
+            # an older version of the file is never used again
+            for stale in [other for other in self._models if other[:2] == key[:2]]:
+                self._evict(stale)
+
+            model = loader(key[1])
+            self._models[key] = (model, os.path.getsize(key[1]), on_evict)
+            self._bytes += self._models[key][1]
+            # always keep the model that was just loaded
+            while self._bytes > self.max_bytes and len(self._models) > 1:
+                self._evict(next(iter(self._models)))
+            return model
+
+    def evict(self, path: Optional[str] = None, kind: Optional[str] = None) -> None:
+        """Drop the models of a file and/or kind, every model by default"""
+        path = None if path is None else os.path.abspath(path)
+        with self._lock:
+            for key in list(self._models):
+                if (kind is None or key[0] == kind) and (path is None or key[1] == path):
+                    self._evict(key)
+
+    def clear(self) -> None:
+        self.evict()
+
+    def _evict(self, key: Tuple[str, str, float]) -> None:
+        model, nbytes, on_evict = self._models.pop(key)
+        self._bytes -= nbytes
+        if on_evict is not None:
+            on_evict(model)
+
+
+def load_pickle(path: str) -> Any:
+    with open(path, "rb") as model_file:
+        return pickle.load(model_file)
+
+
+def load_classifier(path: str) -> Any:
+    """Random Forest or XGBoost model, XGBoost boosters saved in their native
+    binary or UBJSON format load much faster than pickles"""
+    if os.path.splitext(path)[1].lower() in XGBOOST_EXTENSIONS:
+        import xgboost as xgb
+
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return booster
+    return load_pickle(path)
+
+
+MODEL_REGISTRY = ModelRegistry()
@@ -0,0 +1,142 @@
+"""
+Per-point neighbourhood features for the Random Forest and XGBoost point cloud
+classifiers. Every point gets its height above the lowest point of its grid
+cell and, from the covariance of its k nearest neighbours, the verticality of
+its normal, planarity and linearity. Neighbours are queried in batches from
+one KD-tree on every core, and the features of a cloud are cached to disk.
+"""
+import os
+import tempfile
+from hashlib import blake2b
+from typing import Optional
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utils.io_las import read_las_array
+
+FEATURE_NAMES = ("height_above_min", "verticality", "planarity", "linearity")
+# bump when the features change, older cache files are then ignored
+FEATURE_VERSION = 1
+# points whose neighbourhoods are gathered at a time
+FEATURE_BATCH_SIZE = 200_000
+
+
+def _cell_order(xyz: np.ndarray, cell_size: float):
+    # points sorted by their XY grid cell, with the first sorted point of every cell
+    cells = np.floor((xyz[:, :2] - xyz[:, :2].min(axis=0)) / cell_size).astype(np.int64)
+    keys = cells[:, 0] * (int(cells[:, 1].max()) + 1) + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, starts
+
+
+def height_above_min(sorted_xyz: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Height of every point above the lowest point of its XY grid cell, for
+    points sorted by cell as _cell_order does"""
+    cell_min = np.minimum.reduceat(sorted_xyz[:, 2], starts)
+    return sorted_xyz[:, 2] - np.repeat(cell_min, np.diff(np.r_[starts, len(sorted_xyz)]))
+
+
+def covariance_features(neighbours: np.ndarray) -> np.ndarray:
+    """Verticality, planarity and linearity of (n, k, 3) neighbourhoods, from
+    the eigen decomposition of their covariance matrices in one batch"""
+    centred = neighbours - neighbours.mean(axis=1, keepdims=True)
+    covariance = centred.transpose(0, 2, 1) @ centred / neighbours.shape[1]
+    # ascending eigenvalues, the normal is the eigenvector of the smallest
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    smallest, middle, largest = eigenvalues[:, 0], eigenvalues[:, 1], eigenvalues[:, 2]
+    scale = np.where(largest > 0, largest, 1.0)
+
+    features = np.empty((len(neighbours), 3), dtype=np.float32)
+    features[:, 0] = 1.0 - np.abs(eigenvectors[:, 2, 0])
+    features[:, 1] = (middle - smallest) / scale
+    features[:, 2] = (largest - middle) / scale
+    return features
+
+
+def neighbourhood_features(
+    xyz: np.ndarray,
+    k: int = 16,
+    cell_size: float = 10.0,
+    batch_size: int = FEATURE_BATCH_SIZE,
+    workers: int = -1,
+) -> np.ndarray:
+    """
+    Features of FEATURE_NAMES for every point.
+
+    Args:
+    - xyz: (N, 3) point coordinates
+    - k: neighbours per point, the point itself included
+    - cell_size: grid cell size in meters of the local minimum height
+    - batch_size: points queried and decomposed at a time, bounds the memory
+    - workers: KD-tree query threads, -1 for every core
+
+    Returns:
+    - (N, len(FEATURE_NAMES)) float32 array
+    """
+    # relative coordinates keep the covariances precise
+    xyz = np.asarray(xyz, dtype=np.float64)
+    xyz = xyz - xyz.min(axis=0)
+    k = min(k, len(xyz))
+
+    features = np.empty((len(xyz), len(FEATURE_NAMES)), dtype=np.float32)
+    order, starts = _cell_order(xyz, cell_size)
+    sorted_xyz = xyz[order]
+    features[order, 0] = height_above_min(sorted_xyz, starts)
+
+    # the tree and the query batches follow the grid order, so neighbouring
+    # queries touch the same nodes and points
+    tree = cKDTree(sorted_xyz, balanced_tree=False, compact_nodes=False)
+    for start in range(0, len(xyz), batch_size):
+        stop = min(start + batch_size, len(xyz))
+        _, idx = tree.query(sorted_xyz[start:stop], k=k, workers=workers)
+        features[order[start:stop], 1:] = covariance_features(sorted_xyz[idx.reshape(stop - start, k)])
+    return features
+
+
+def cached_point_features(
+    las_path: str,
+    cache_dir: Optional[str] = None,
+    k: int = 16,
+    cell_size: float = 10.0,
+    workers: int = -1,
+) -> np.ndarray:
+    """
+    Neighbourhood features of every point of a LAS/LAZ file, in file order.
+    They are computed once per file version and settings, later calls map
+    the cached array from disk.
+
+    The first call reads every point and builds one KD-tree over the whole
+    cloud, so its memory grows with the cloud and not with the prediction
+    chunk size: about 100 bytes per point plus 250 MB for the query batches
+    of FEATURE_BATCH_SIZE points (some 10 GB for 100 million points).
+
+    Args:
+    - las_path: LAS or LAZ file
+    - cache_dir: cache directory (default: the temporary directory)
+    - k, cell_size, workers: see neighbourhood_features
+
+    Returns:
+    - (N, len(FEATURE_NAMES)) float32 array, memory mapped when cached
+    """
+    las_path = os.path.abspath(las_path)
+    stat = os.stat(las_path)
+    digest = blake2b(
+        repr((FEATURE_VERSION, las_path, stat.st_size, stat.st_mtime_ns, k, cell_size)).encode(),
+        digest_size=8,
+    ).hexdigest()
+    cache_dir = os.path.join(tempfile.gettempdir(), "cascade-3d-features") if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(las_path))[0]}_{digest}.npy")
+
+    if os.path.exists(cache_file):
+        return np.load(cache_file, mmap_mode="r")
+
+    features = neighbourhood_features(read_las_array(las_path, ("x", "y", "z")), k, cell_size, workers=workers)
+    # written under a temporary name, an interrupted run leaves no partial cache
+    partial_file = f"{cache_file}.partial.npy"
+    np.save(partial_file, features)
+    os.replace(partial_file, cache_file)
+    return features